@@ -7,7 +7,11 @@ from discord.ext import bridge, commands
 from setuptools import find_namespace_packages
 
 from bot.config import TOKEN, LOG_FILENAME
+from bot.database.store import SubmissionStore
 from bot.judge import Judge
+from bot.judge.cache import VerdictCache
+from bot.judge.ranklist import Ranklist
+from bot.judge.pool import JudgePool
 
 
 log = logging.getLogger(os.path.basename(os.path.dirname(__file__)))
@@ -68,10 +72,23 @@ class DiscordBotSync(bridge.Bot):
         self.init_logger(debug=debug)
         log.info("Initializing Judge...")
         Judge.init()
+        JudgePool.init()
+        
+        log.info("Initializing database...")
+        SubmissionStore.init()
+        Judge.ranklist = Ranklist(SubmissionStore.best_scores())
+        VerdictCache.init(loader=SubmissionStore.verdict)
         self.load()
         
         super().run(token, **kwargs)
         
+        
+    async def close(self) -> None:
+        
+        JudgePool.shutdown()
+        await SubmissionStore.close()
+        await super().close()
+        
 
 bot = DiscordBotSync("?")
 
@@ -1,12 +1,22 @@
+import asyncio
 import discord
 from discord.ext import commands
 import datetime
 import logging
 from setuptools import find_namespace_packages
 
-from bot.config import BASEDIR
+from bot.config import BASEDIR, QUEUE_UPDATE_INTERVAL
 from bot.utils.help import HelpCommandSettings
 from bot.utils.embed import EmbedMaker
+from bot.database.store import SubmissionStore
+from bot.judge import Judge
+from bot.judge.cache import VerdictCache
+from bot.judge.corpus import TestCorpus
+from bot.judge.metrics import Metrics
+from bot.judge.pool import JudgePool
+from bot.judge.queue import SubmissionQueue
+from bot.judge.ranklist import Ranklist
+from bot.judge.rejudge import Rejudge
 
 
 log = logging.getLogger(__name__)
@@ -85,6 +95,110 @@ class HelpTools(commands.Cog):
         
         log.debug(f"{ctx.author.name}({ctx.author.id}) used {ctx.command.name}.")
                 
+        
+    @commands.command(name="rotate")
+    @commands.has_permissions(administrator=True)
+    async def rotate(self, ctx: discord.ApplicationContext):
+        
+        old_version = Judge.corpus.version
+        
+        # Generating runs the reference solver, keep it off the event loop
+        corpus = await asyncio.get_running_loop().run_in_executor(None, TestCorpus.rotate)
+        
+        Judge.init(corpus)
+        JudgePool.restart()
+        VerdictCache.clear()
+        
+        await ctx.message.reply(embed=EmbedMaker(status=True, description=f"**已更換測試資料:**\n```{old_version} -> {corpus.version} ({len(corpus)} 筆)```"))
+        
+        log.info(f"Rotated test corpus {old_version} -> {corpus.version}")
+        log.debug(f"{ctx.author.name}({ctx.author.id}) used {ctx.command.name}.")
+        
+        
+    @commands.command(name="rescore")
+    @commands.has_permissions(administrator=True)
+    async def rescore(self, ctx: discord.ApplicationContext):
+        
+        # Make sure the verdicts which are still pending are rescored too
+        await SubmissionStore.flush()
+        
+        count = await asyncio.to_thread(SubmissionStore.rescore)
+        Judge.ranklist = Ranklist(await asyncio.to_thread(SubmissionStore.best_scores))
+        
+        await ctx.message.reply(embed=EmbedMaker(status=True, description=f"**已重新計算 {count} 筆提交的分數**"))
+        
+        log.debug(f"{ctx.author.name}({ctx.author.id}) used {ctx.command.name}.")
+        
+        
+    @commands.command(name="rejudge")
+    @commands.has_permissions(administrator=True)
+    async def rejudge(self, ctx: discord.ApplicationContext, concurrency: int=None):
+        
+        if Rejudge.running:
+            await ctx.message.reply(embed=EmbedMaker(status=False, description="**已經有重新評測正在進行中**"))
+            return
+        
+        progress = await ctx.message.reply(embed=EmbedMaker(title="**重新評測**", description="**準備重新評測所有提交...**"))
+        task = asyncio.create_task(Rejudge.run(concurrency))
+        
+        while not task.done():
+            await asyncio.wait({task}, timeout=QUEUE_UPDATE_INTERVAL)
+            
+            if task.done():
+                break
+                
+            eta = Rejudge.eta()
+            description = f"**重新評測中: {Rejudge.done}/{Rejudge.total}**"
+            description += f"\n預計剩餘 {eta:.0f} 秒" if eta is not None else ""
+            
+            try:
+                await progress.edit(embed=EmbedMaker(title="**重新評測**", description=description))
+            except discord.HTTPException:
+                log.warning("Failed to update rejudge progress", exc_info=True)
+                
+        try:
+            count = task.result()
+            embed = EmbedMaker(status=True, description=f"**已重新評測 {count} 筆提交 (實際執行 {Rejudge.judged} 份不同的程式)**")
+            
+        except Exception as e:
+            log.error("Rejudge failed!", exc_info=True)
+            embed = EmbedMaker(status=False, description=f"**重新評測時發生了錯誤，錯誤如下:**\n``` * {e}```")
+            
+        await progress.edit(embed=embed)
+        
+        log.debug(f"{ctx.author.name}({ctx.author.id}) used {ctx.command.name}.")
+        
+        
+    @commands.slash_command(name="judgestats")
+    @discord.default_permissions(administrator=True)
+    @commands.has_permissions(administrator=True)
+    async def judgestats(self, ctx: discord.ApplicationContext):
+        """Show the time spent in each phase of judging and the state of the queue."""
+        
+        if not Metrics.enabled:
+            await ctx.respond(embed=EmbedMaker(status=False, description="**統計功能未啟用 (METRICS_ENABLED)**"), ephemeral=True)
+            return
+        
+        embed = EmbedMaker(title="**評測統計**", description=f"最近 {Metrics.window} 筆的各階段耗時 (秒)")
+        
+        for name, stats in Metrics.summary().items():
+            embed.add_field(
+                name=name,
+                value=f"```n={stats['count']}\nmean={stats['mean']:.4f}\np50={stats['p50']:.4f}\np95={stats['p95']:.4f}\np99={stats['p99']:.4f}```",
+                inline=True,
+            )
+            
+        queue = SubmissionQueue.metrics()
+        gauges = Metrics.read_gauges()
+        embed.add_field(
+            name="佇列",
+            value=f"```排隊: {queue['depth']}/{queue['max_depth']} (最高 {queue['peak_depth']})\n評測中: {queue['running']}/{JudgePool.workers}\n使用率: {gauges.get('worker_utilisation', 0):.0%}\n已拒絕: {queue['rejected']}```",
+            inline=False,
+        )
+        
+        await ctx.respond(embed=embed, ephemeral=True)
+        
+        log.debug(f"{ctx.author.name}({ctx.author.id}) used {ctx.command.name}.")
 
 
 def setup(bot: commands.Bot):
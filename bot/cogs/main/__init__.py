@@ -6,6 +6,7 @@ from bot.cogs.main.help import Help
 from bot.utils.help import HelpCommandSettings, need_help
 from bot.utils.emoji import EmojiManager
 from bot.config import LOCALE
+from bot.judge.metrics import Metrics
 
 
 log = logging.getLogger(__name__)
@@ -29,6 +30,8 @@ class Main(commands.Cog):
         HelpCommandSettings.set_command_list(list(self.bot.all_commands.values()))
         self.bot.help_command = Help()
         
+        Metrics.start()
+        
         log.info(f"Bot is running as {self.bot.user}!")
         
         
@@ -1,25 +1,80 @@
+import asyncio
 import logging
+from collections.abc import Sequence
 
 import discord
 from discord.ext import commands
 
 from bot.utils.embed import EmbedMaker
 from bot.utils.button import PageButton
+from bot.database.store import SubmissionStore
 from bot.judge import Judge, Status
+from bot.judge.cache import VerdictCache
+from bot.judge.precheck import precheck
+from bot.judge.ranklist import Ranklist
+from bot.judge.queue import QueueFull, Submission, SubmissionQueue
+from bot.config import QUEUE_UPDATE_INTERVAL, DATA_SIZE_LIMIT
 
 
 log = logging.getLogger(__name__)
 
 
+STATUS_NAMES = {
+    Status.AC: "Accept",
+    Status.WA: "Wrong Answer",
+    Status.TLE: "Time Limit Exceed",
+    Status.RE: "Rumtime Error",
+    Status.CE: "Compile Error",
+}
+
+
+class RanklistFields(Sequence):
+    """Embed fields of the ranklist, only the requested slice is built."""
+    
+    def __init__(self, ranklist: Ranklist):
+        self.ranklist = ranklist
+        
+        
+    def __len__(self) -> int:
+        return len(self.ranklist)
+    
+    
+    def __getitem__(self, index: slice) -> list:
+        
+        start, stop, _ = index.indices(len(self.ranklist))
+        
+        return [
+            {"name": f"", "value": f"***{str(k)} - Score: {round(v, 2)}***", "inline": False}
+            for k, v in self.ranklist.page(start, stop - start)
+        ]
+
+
 class Upload(commands.Cog):
     
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        self.running = False
         
+        
+    async def update_waiting(self, waiting_resp: discord.Interaction, submission: Submission) -> None:
+        """Show the queue position and ETA in the waiting message."""
+        
+        if submission.running:
+            content = "正在評測中，請稍後..."
+            
+        else:
+            eta = SubmissionQueue.eta(submission)
+            content = f"正在排隊中，前面還有 {SubmissionQueue.position(submission)} 份程式"
+            content += f"，預計等待 {eta:.0f} 秒..." if eta is not None else "..."
+            
+        try:
+            await waiting_resp.edit_original_response(content=content)
+        except discord.HTTPException:
+            log.warning("Failed to update waiting message", exc_info=True)
+            
+            
     @commands.slash_command(name="upload")
-    async def upload(self, ctx: discord.ApplicationContext, file: discord.Attachment, data: discord.Attachment=None):
-        """Upload a file to the server."""
+    async def upload(self, ctx: discord.ApplicationContext, file: discord.Attachment, data: discord.Attachment=None, rerun: bool=False):
+        """Upload a file to the server, set rerun to judge it again instead of reusing the cached verdict."""
         
         if not file.filename.endswith(".py"):
             embed = EmbedMaker(
@@ -39,36 +94,79 @@ class Upload(commands.Cog):
             await ctx.respond(embed=embed)
             return
         
-        if self.running:
+        if data and data.size > DATA_SIZE_LIMIT * 1024 * 1024:
             embed = EmbedMaker(
                 title="錯誤 :animation_no:",
-                description="目前正在運行中，請稍後再試！",
-                color=discord.Color.red(),
+                description=f"資料檔案不能超過 {DATA_SIZE_LIMIT}MiB！",
+                color="red",
             )
             await ctx.respond(embed=embed)
             return
         
-        waiting_resp = await ctx.respond("正在運行中，請稍後...", ephemeral=True)
+        waiting_resp = await ctx.respond("正在排隊中，請稍後...", ephemeral=True)
+        
+        file_content = await file.read()
+        data_content = await data.read() if data else None
+        data_filename = data.filename if data else None
+        
+        verdict_key = VerdictCache.key(file_content, data_content, data_filename, Judge.corpus.version)
+        
+        # Broken sources are rejected here without taking a place in the queue
+        result = precheck(file_content, Judge.corpus.version)
+        cached = False
         
-        self.running = True
-        status_code, msg = \
-            Judge.judge(file=await file.read(), data=await data.read(), data_filename=data.filename) \
-            if data else Judge.judge(file=await file.read())
+        if result is None and not rerun:
+            result = await VerdictCache.get(verdict_key)
+            cached = result is not None
+        
+        if result is None:
+            try:
+                submission = SubmissionQueue.put(ctx.author.id, file=file_content, data=data_content, data_filename=data_filename)
+                    
+            except QueueFull:
+                embed = EmbedMaker(
+                    title="錯誤 :animation_no:",
+                    description="目前排隊人數已滿，請稍後再試！",
+                    color="red",
+                )
+                await waiting_resp.edit_original_response(content=None, embed=embed)
+                return
+            
+            while not submission.future.done():
+                await self.update_waiting(waiting_resp, submission)
+                await asyncio.wait({submission.future}, timeout=QUEUE_UPDATE_INTERVAL)
+                
+            result = submission.future.result()
+            VerdictCache.put(verdict_key, result)
             
-        self.running = False
-        log.debug(f"status_code: {status_code}, msg: {msg}")
+        log.debug(f"status_code: {result.status}, msg: {result.message}, cached: {cached}")
+        
+        SubmissionStore.add(
+            user_id=ctx.author.id,
+            username=ctx.author.name,
+            file=file_content,
+            data=data_content,
+            data_filename=data_filename,
+            result=result,
+            verdict_key=verdict_key,
+        )
+        
+        await waiting_resp.edit_original_response(content="評測完成！")
         
         embed = EmbedMaker(
             title="**上傳成功 :animation_yes:**",
-            description=f"```{msg}```",
+            description=f"```{result.message}```",
         )
         embed.set_author(name=ctx.author.name, icon_url=ctx.author.display_avatar.url)
         
-        match status_code:
+        if cached:
+            embed.set_footer(text="相同的程式已評測過，此為先前的結果，如需重新計時請使用 rerun 選項")
+            
+        match result.status:
             case Status.AC: 
                 embed.color = discord.Color.green()
                 embed.add_field(name="測試結果: ", value="Accept", inline=True)
-                Judge.record(ctx.author.name)
+                Judge.record(ctx.author.name, result.score)
                 
             case Status.WA: 
                 embed.color = discord.Color.red()
@@ -86,7 +184,6 @@ class Upload(commands.Cog):
                 embed.color = discord.Color.orange()
                 embed.add_field(name="測試結果: ", value="Compile Error", inline=True)
 
-        Judge.reset()
         await ctx.send(embed=embed)
         
         log.debug(f"{ctx.author.name}({ctx.author.id}) used {ctx.command.name}.")
@@ -103,13 +200,67 @@ class Upload(commands.Cog):
         )
         page_button = PageButton(
             embed=embed,
-            data=[{"name": f"", "value": f"***{str(k)} - Score: {round(v, 2)}***", "inline": False} for k, v in Judge.ranklist.items()],
+            data=RanklistFields(Judge.ranklist),
             limit=5,
             ctx=ctx
         )
         await ctx.respond(embed=page_button.get_embed(), view=page_button)
         
         log.debug(f"{ctx.author.name}({ctx.author.id}) used {ctx.command.name}.")
+        
+        
+    @commands.slash_command(name="history")
+    async def history(self, ctx: discord.ApplicationContext):
+        """Show your submission history."""
+        
+        embed = discord.Embed(
+            title="**提交紀錄**",
+            description="",
+            color=discord.Color.gold()
+        )
+        
+        async def provider(offset: int, limit: int) -> list:
+            submissions = await asyncio.to_thread(SubmissionStore.history, ctx.author.id, offset, limit)
+            
+            return [
+                {
+                    "name": f"{submission.created_at:%Y-%m-%d %H:%M:%S} - {STATUS_NAMES.get(submission.status, submission.status)}",
+                    "value": f"```{submission.message}```",
+                    "inline": False,
+                }
+                for submission in submissions
+            ]
+            
+        page_button = PageButton(embed=embed, limit=5, ctx=ctx, provider=provider)
+        await ctx.respond(embed=await page_button.load(), view=page_button, ephemeral=True)
+        
+        log.debug(f"{ctx.author.name}({ctx.author.id}) used {ctx.command.name}.")
+        
+        
+    @commands.slash_command(name="rank")
+    async def rank(self, ctx: discord.ApplicationContext):
+        """Show your rank."""
+        
+        rank = Judge.ranklist.rank(ctx.author.name)
+        
+        if rank is None:
+            embed = EmbedMaker(
+                title="**我的排名**",
+                description="目前還沒有通過的紀錄！",
+                color="gold",
+            )
+            
+        else:
+            embed = EmbedMaker(
+                title="**我的排名**",
+                description=f"***第 {rank} 名 (共 {len(Judge.ranklist)} 人) - Score: {round(Judge.ranklist.get(ctx.author.name), 2)}***",
+                color="gold",
+            )
+            
+        embed.set_author(name=ctx.author.name, icon_url=ctx.author.display_avatar.url)
+        await ctx.respond(embed=embed, ephemeral=True)
+        
+        log.debug(f"{ctx.author.name}({ctx.author.id}) used {ctx.command.name}.")
 
 
 def setup(bot: commands.Bot):
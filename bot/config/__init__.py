@@ -18,4 +18,29 @@ LOG_FILENAME = SETTINGS["LOG_FILENAME"]
 
 # Judge Settings
 TIME_LIMIT = SETTINGS["TIME_LIMIT"]
-CUBE_SIZE = SETTINGS["CUBE_SIZE"]
\ No newline at end of file
+CUBE_SIZE = SETTINGS["CUBE_SIZE"]
+MEMORY_LIMIT = SETTINGS["MEMORY_LIMIT"]
+TEST_CASES = SETTINGS["TEST_CASES"]
+SCRAMBLE_LENGTH = SETTINGS["SCRAMBLE_LENGTH"]
+STEP_METRIC = SETTINGS["STEP_METRIC"]
+CORPUS_DIR = SETTINGS["CORPUS_DIR"]
+TABLES_DIR = SETTINGS["TABLES_DIR"]
+REFERENCE_SEARCH_NODES = SETTINGS["REFERENCE_SEARCH_NODES"]
+DATA_DIR = SETTINGS["DATA_DIR"]
+DATA_SIZE_LIMIT = SETTINGS["DATA_SIZE_LIMIT"]
+SOURCE_SIZE_LIMIT = SETTINGS["SOURCE_SIZE_LIMIT"]
+PARALLEL_TEST_CASES = SETTINGS["PARALLEL_TEST_CASES"]
+PARALLEL_WORKERS = SETTINGS["PARALLEL_WORKERS"]
+JUDGE_WORKERS = SETTINGS["JUDGE_WORKERS"]
+JUDGE_TIMEOUT = SETTINGS["JUDGE_TIMEOUT"]
+JUDGE_START_METHOD = SETTINGS["JUDGE_START_METHOD"]
+SETUP_TIME_LIMIT = SETTINGS["SETUP_TIME_LIMIT"]
+QUEUE_MAX_DEPTH = SETTINGS["QUEUE_MAX_DEPTH"]
+QUEUE_UPDATE_INTERVAL = SETTINGS["QUEUE_UPDATE_INTERVAL"]
+VERDICT_CACHE_SIZE = SETTINGS["VERDICT_CACHE_SIZE"]
+
+# Metrics Settings
+METRICS_ENABLED = SETTINGS["METRICS_ENABLED"]
+METRICS_WINDOW = SETTINGS["METRICS_WINDOW"]
+METRICS_FILE = SETTINGS["METRICS_FILE"]
+METRICS_DUMP_INTERVAL = SETTINGS["METRICS_DUMP_INTERVAL"]
\ No newline at end of file
@@ -0,0 +1,26 @@
+import logging
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import DeclarativeBase, sessionmaker
+
+from bot.config import SQL_URL
+
+
+log = logging.getLogger(__name__)
+
+engine = create_engine(SQL_URL)
+Session = sessionmaker(engine, expire_on_commit=False)
+
+
+class Base(DeclarativeBase):
+    pass
+
+
+def init_db() -> None:
+    """Create the tables which do not exist yet."""
+
+    from bot.database import models
+
+    Base.metadata.create_all(engine)
+
+    log.info(f"Database ready at {engine.url.render_as_string(hide_password=True)}")
@@ -0,0 +1,62 @@
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import BigInteger, DateTime, Float, ForeignKey, Index, Integer, JSON, LargeBinary, String, Text
+from sqlalchemy.orm import Mapped, mapped_column
+
+from bot.database import Base
+
+
+class Source(Base):
+    """Uploaded file stored once by its SHA-256."""
+
+    __tablename__ = "sources"
+
+    hash: Mapped[str] = mapped_column(String(64), primary_key=True)
+    content: Mapped[bytes] = mapped_column(LargeBinary)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+
+class Submission(Base):
+    """One judged upload with its verdict and per-case results."""
+
+    __tablename__ = "submissions"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    user_id: Mapped[int] = mapped_column(BigInteger)
+    username: Mapped[str] = mapped_column(String(100))
+    code_hash: Mapped[str] = mapped_column(ForeignKey("sources.hash"))
+    data_hash: Mapped[Optional[str]] = mapped_column(ForeignKey("sources.hash"))
+    data_filename: Mapped[Optional[str]] = mapped_column(String(255))
+    corpus_version: Mapped[str] = mapped_column(String(16))
+    # VerdictCache.key of the upload, None for verdicts which should not be reused
+    verdict_key: Mapped[Optional[str]] = mapped_column(String(64))
+    status: Mapped[int] = mapped_column(Integer)
+    message: Mapped[str] = mapped_column(Text)
+    score: Mapped[float] = mapped_column(Float, default=0.0)
+    # [{"time", "cpu_time", "steps", "max_steps", "rss"}, ...] of the cases which passed
+    cases: Mapped[list] = mapped_column(JSON, default=list)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_submissions_user_id_created_at", "user_id", "created_at"),
+        Index("ix_submissions_score", "score"),
+        Index("ix_submissions_code_hash", "code_hash"),
+        Index("ix_submissions_verdict_key", "verdict_key"),
+    )
+
+
+class BestScore(Base):
+    """Best accepted score of every user."""
+
+    __tablename__ = "best_scores"
+
+    user_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    username: Mapped[str] = mapped_column(String(100))
+    score: Mapped[float] = mapped_column(Float)
+    submission_id: Mapped[int] = mapped_column(ForeignKey("submissions.id"))
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_best_scores_score", "score"),
+    )
@@ -0,0 +1,323 @@
+import asyncio
+import hashlib
+import logging
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.orm import aliased
+
+from bot.database import Session, init_db
+from bot.database.models import BestScore, Source, Submission
+from bot.judge import scoring
+from bot.judge.cache import CACHEABLE
+from bot.judge.result import CaseResult, JudgeResult, Status
+
+
+log = logging.getLogger(__name__)
+
+# Seconds to wait for more verdicts before writing a batch
+FLUSH_INTERVAL = 1.0
+
+
+class SubmissionStore:
+    """Records verdicts in the database in batches, off the event loop."""
+
+    pending: List[dict] = []
+    task: asyncio.Task = None
+
+    @classmethod
+    def init(cls) -> None:
+
+        init_db()
+
+
+    @classmethod
+    def add(cls, user_id: int, username: str, file: bytes, result: JudgeResult, data: bytes=None, data_filename: str=None, verdict_key: str=None) -> None:
+        """Queue a verdict, it is written by a background task."""
+
+        cls.pending.append({
+            "user_id": user_id,
+            "username": username,
+            "file": file,
+            "data": data,
+            "data_filename": data_filename,
+            "status": result.status,
+            "message": result.message,
+            "score": result.score,
+            "cases": [case._asdict() for case in result.cases],
+            "corpus_version": result.corpus_version,
+            "verdict_key": verdict_key if result.status in CACHEABLE else None,
+        })
+
+        if cls.task is None or cls.task.done():
+            cls.task = asyncio.create_task(cls._flush())
+
+
+    @classmethod
+    async def _flush(cls) -> None:
+
+        await asyncio.sleep(FLUSH_INTERVAL)
+
+        while cls.pending:
+            batch, cls.pending = cls.pending, []
+
+            try:
+                await asyncio.to_thread(cls.write, batch)
+            except Exception:
+                log.error(f"Failed to record {len(batch)} submissions", exc_info=True)
+
+
+    @classmethod
+    async def flush(cls) -> None:
+        """Write every verdict queued so far off the event loop, the store keeps accepting new ones."""
+
+        # Waiting on the task instead of awaiting it, a cancelled caller must not cancel the writes of others
+        if cls.task is not None:
+            await asyncio.wait([cls.task])
+
+        if cls.pending:
+            batch, cls.pending = cls.pending, []
+            await asyncio.to_thread(cls.write, batch)
+
+
+    @classmethod
+    async def close(cls) -> None:
+        """Write everything which is still pending before the bot stops."""
+
+        await cls.flush()
+
+
+    @classmethod
+    def write(cls, batch: List[dict]) -> None:
+        """Write a batch of verdicts in one transaction and update the best scores."""
+
+        with Session.begin() as session:
+            sources: Dict[str, bool] = {}
+            best_scores: Dict[int, BestScore] = {}
+
+            def source(content: bytes) -> str:
+                digest = hashlib.sha256(content).hexdigest()
+
+                if digest not in sources:
+                    sources[digest] = session.get(Source, digest) is not None
+
+                    if not sources[digest]:
+                        session.add(Source(hash=digest, content=content))
+                        sources[digest] = True
+
+                return digest
+
+            submissions = []
+
+            for record in batch:
+                submission = Submission(
+                    user_id=record["user_id"],
+                    username=record["username"],
+                    code_hash=source(record["file"]),
+                    data_hash=source(record["data"]) if record["data"] else None,
+                    data_filename=record["data_filename"],
+                    corpus_version=record["corpus_version"],
+                    verdict_key=record["verdict_key"],
+                    status=record["status"],
+                    message=record["message"],
+                    score=record["score"],
+                    cases=record["cases"],
+                )
+                session.add(submission)
+                submissions.append(submission)
+
+            session.flush()
+
+            for submission in submissions:
+                if submission.status != Status.AC:
+                    continue
+
+                if submission.user_id not in best_scores:
+                    best_scores[submission.user_id] = session.get(BestScore, submission.user_id)
+
+                best = best_scores[submission.user_id]
+
+                if best is None:
+                    best = BestScore(user_id=submission.user_id)
+                    session.add(best)
+                    best_scores[submission.user_id] = best
+
+                elif best.score >= submission.score:
+                    continue
+
+                best.username = submission.username
+                best.score = submission.score
+                best.submission_id = submission.id
+
+        log.debug(f"Recorded {len(batch)} submissions.")
+
+
+    @classmethod
+    def best_scores(cls) -> Dict[str, float]:
+        """Return the best score of every user, highest first."""
+
+        with Session() as session:
+            rows = session.execute(select(BestScore.username, BestScore.score).order_by(BestScore.score.desc()))
+
+            return {username: score for username, score in rows}
+
+
+    @classmethod
+    def history(cls, user_id: int, offset: int, limit: int) -> List[Submission]:
+        """Return a page of the user's submissions, newest first."""
+
+        with Session() as session:
+            return list(session.scalars(
+                select(Submission)
+                .where(Submission.user_id == user_id)
+                .order_by(Submission.created_at.desc(), Submission.id.desc())
+                .offset(offset)
+                .limit(limit)
+            ))
+
+
+    @classmethod
+    def verdict(cls, verdict_key: str) -> Optional[JudgeResult]:
+        """Return the latest stored verdict with this cache key."""
+
+        with Session() as session:
+            submission = session.scalars(
+                select(Submission)
+                .where(Submission.verdict_key == verdict_key)
+                .order_by(Submission.id.desc())
+                .limit(1)
+            ).first()
+
+        if submission is None:
+            return None
+
+        cases = [CaseResult(**case) for case in submission.cases or []]
+
+        return JudgeResult(submission.status, submission.message, cases, submission.corpus_version)
+
+
+    @classmethod
+    def rescore(cls) -> int:
+        """Recompute the score of every accepted submission from its stored cases.
+
+        The per-case results are summed and scored with numpy over the whole
+        table, written back with one bulk update, and the best scores are rebuilt
+        from the new scores. Returns the number of rescored submissions.
+        """
+
+        with Session.begin() as session:
+            rows = session.execute(
+                select(Submission.id, Submission.cases)
+                .where(Submission.status == Status.AC)
+            ).all()
+
+            if not rows:
+                return 0
+
+            ids = np.array([row.id for row in rows], dtype=np.int64)
+            time, steps, max_steps = scoring.totals([row.cases or [] for row in rows])
+            scores = scoring.score_arrays(time, steps, max_steps)
+
+            session.execute(update(Submission), [
+                {"id": int(submission_id), "score": float(score)}
+                for submission_id, score in zip(ids, scores)
+            ])
+
+            users = cls.rebuild_best_scores(session)
+
+        log.info(f"Rescored {len(rows)} submissions of {users} users.")
+
+        return len(rows)
+
+
+    @classmethod
+    def rebuild_best_scores(cls, session) -> int:
+        """Replace the best scores with the best accepted submission of every user, return the number of users."""
+
+        rows = session.execute(
+            select(Submission.id, Submission.user_id, Submission.username, Submission.score)
+            .where(Submission.status == Status.AC)
+        ).all()
+
+        session.execute(delete(BestScore))
+
+        if not rows:
+            return 0
+
+        ids = np.array([row.id for row in rows], dtype=np.int64)
+        user_ids = np.array([row.user_id for row in rows], dtype=np.int64)
+        scores = np.array([row.score for row in rows], dtype=np.float64)
+
+        # Best submission of every user: sort by user, then by score descending
+        order = np.lexsort((-scores, user_ids))
+        first = order[np.unique(user_ids[order], return_index=True)[1]]
+
+        session.execute(insert(BestScore), [
+            {
+                "user_id": int(user_ids[idx]),
+                "username": rows[idx].username,
+                "score": float(scores[idx]),
+                "submission_id": int(ids[idx]),
+            }
+            for idx in first
+        ])
+
+        return len(first)
+
+
+    @classmethod
+    def count(cls) -> int:
+
+        with Session() as session:
+            return session.scalar(select(func.count()).select_from(Submission))
+
+
+    @classmethod
+    def sources(cls, after_id: int, limit: int) -> List[Tuple[int, bytes, Optional[bytes], Optional[str]]]:
+        """Return (id, file, data, data_filename) of the next submissions after after_id, in id order."""
+
+        code = aliased(Source)
+        data = aliased(Source)
+
+        with Session() as session:
+            return [tuple(row) for row in session.execute(
+                select(Submission.id, code.content, data.content, Submission.data_filename)
+                .join(code, Submission.code_hash == code.hash)
+                .outerjoin(data, Submission.data_hash == data.hash)
+                .where(Submission.id > after_id)
+                .order_by(Submission.id)
+                .limit(limit)
+            )]
+
+
+    @classmethod
+    def update_verdicts(cls, verdicts: List[Tuple[int, JudgeResult, str]]) -> None:
+        """Overwrite the verdicts of stored submissions with (id, result, verdict key) in one transaction."""
+
+        if not verdicts:
+            return
+
+        with Session.begin() as session:
+            session.execute(update(Submission), [
+                {
+                    "id": submission_id,
+                    "status": result.status,
+                    "message": result.message,
+                    "score": result.score,
+                    "cases": [case._asdict() for case in result.cases],
+                    "corpus_version": result.corpus_version,
+                    "verdict_key": verdict_key if result.status in CACHEABLE else None,
+                }
+                for submission_id, result, verdict_key in verdicts
+            ])
+
+        log.debug(f"Updated {len(verdicts)} verdicts.")
+
+
+    @classmethod
+    def refresh_best_scores(cls) -> int:
+        """Rebuild the best scores in their own transaction."""
+
+        with Session.begin() as session:
+            return cls.rebuild_best_scores(session)
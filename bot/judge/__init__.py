@@ -1,221 +1,355 @@
-import concurrent.futures
 import inspect
 import logging
-import math
 import os
-from datetime import datetime
-from typing import Callable, Tuple, Optional, get_type_hints
+import signal
+import threading
+from typing import Callable, Iterator, List, Sequence, Tuple, Optional, Union, get_type_hints
 
+import numpy as np
 from magiccube import Cube
 from magiccube.cube_base import CubeException
-from magiccube.solver.basic.basic_solver import BasicSolver
 
-from bot.config import TIME_LIMIT, CUBE_SIZE
+from bot.config import TIME_LIMIT, CUBE_SIZE, MEMORY_LIMIT, PARALLEL_TEST_CASES, PARALLEL_WORKERS, SETUP_TIME_LIMIT, STEP_METRIC
+from bot.judge import sandbox
+from bot.judge.corpus import TestCorpus
 from bot.judge.example import Solver as ExampleSolver
+from bot.judge.loader import SubmissionLoader
+from bot.judge.metrics import Metrics
+from bot.judge.ranklist import Ranklist
+from bot.judge.result import CaseResult, JudgeResult, Status
+from bot.judge.sandbox import RunResult
+from bot.judge.twophase import TwoPhaseSolver
+from bot.judge.verifier import Verifier
 
-class Status:
-    AC = 0
-    WA = 1
-    TLE = 2
-    RE = 3
-    CE = 4
+
+# Methods of the example Solver which a submission may leave out
+OPTIONAL_METHODS = {"setup"}
 
 
 class Judge:
     """Judge class to handle the judging process."""
     
-    ranklist = {}
-    time = 0
-    steps = 0
-    max_steps = 0
-    cube = Cube(CUBE_SIZE)
+    ranklist = Ranklist()
     
     @classmethod
-    def init(cls) -> None:
+    def init(cls, corpus: TestCorpus=None) -> None:
         """Initialize the Judge class."""
         
         cls.logger = logging.getLogger(__name__)
         
-        # Test cases
-        cls.test_cases: list = []
+        # The reference solver tables are mapped before a corpus may have to be generated
+        if corpus is None and CUBE_SIZE == 3:
+            TwoPhaseSolver.get()
+            
+        # Test cases, scrambled states and reference solutions are loaded from the corpus
+        cls.corpus = corpus or TestCorpus.current()
+        cls.test_cases: List[str] = cls.corpus.scrambles
+        cls.verifier = Verifier(cls.corpus.cube_size, STEP_METRIC)
         
-        for _ in range(10):
-            cube = Cube(CUBE_SIZE)
-            cls.test_cases.append(cube.generate_random_moves(20))
+        cls.logger.info(f"Loaded test corpus {cls.corpus.version} with {len(cls.corpus)} test cases.")
             
 
     @classmethod
-    def judge(cls, file: bytes, data: bytes=None, data_filename: str=None) -> Tuple[int, str]:
-        """Judge the file and return the status code and message."""
+    def judge(cls, file: bytes, data: bytes=None, data_filename: str=None, data_path: str=None) -> JudgeResult:
+        """Judge the file and return the result with the time spent in each phase.
         
-        # File
-        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "test")
+        The data file is passed either as data and data_filename, or as the
+        data_path of its DataStore entry.
+        """
         
-        if not os.path.exists(path):
-            os.makedirs(path)
+        timings = Metrics.timings()
         
-        with open(os.path.join(path, "__init__.py"), "wb") as f:
-            f.write(file)
+        with Metrics.span(timings, "total"):
+            result = cls._judge(file, data, data_filename, data_path, timings)
             
-        if data and data_filename:
-            with open(os.path.join(path, data_filename), "wb") as f:
-                f.write(data)
-            
-        # Compile Error   
-        try:
-            from bot.judge.test import Solver
+        result.timings = timings
+        
+        return result
+    
+    
+    @classmethod
+    def _judge(cls, file: bytes, data: bytes, data_filename: str, data_path: str, timings: Optional[dict]) -> JudgeResult:
+        
+        with SubmissionLoader(file=file, data=data, data_filename=data_filename, data_path=data_path) as loader:
             
-        except ImportError as e:
-            cls.logger.error(f"ImportError: {e}")
-            return Status.CE, "ImportError: {}".format(e)
+            # Compile Error   
+            try:
+                with Metrics.span(timings, "load"):
+                    Solver = loader.load().Solver
+                
+            except ImportError as e:
+                cls.logger.error(f"ImportError: {e}")
+                return JudgeResult(Status.CE, "ImportError: {}".format(e), corpus_version=cls.corpus.version)
         
-        except SyntaxError as e:
-            cls.logger.error(f"SyntaxError: {e}")
-            return Status.CE, "SyntaxError: {}".format(e)
+            except SyntaxError as e:
+                cls.logger.error(f"SyntaxError: {e}")
+                return JudgeResult(Status.CE, "SyntaxError: {}".format(e), corpus_version=cls.corpus.version)
         
-        except AttributeError as e:
-            cls.logger.error(f"AttributeError: {e}")
-            return Status.CE, "AttributeError: {}".format(e)
+            except AttributeError as e:
+                cls.logger.error(f"AttributeError: {e}")
+                return JudgeResult(Status.CE, "AttributeError: {}".format(e), corpus_version=cls.corpus.version)
+            
+            # Anything else raised by the top level of the module, including SystemExit
+            except BaseException as e:
+                cls.logger.error(f"Runtime Error while loading: {type(e).__name__}: {e}")
+                return JudgeResult(Status.RE, f"Runtime Error while loading: {type(e).__name__}: {e}", corpus_version=cls.corpus.version)
+        
+            # Resolving the type hints runs the annotations of the submission
+            try:
+                with Metrics.span(timings, "signature"):
+                    result = cls.check(Solver)
+                    
+            except BaseException as e:
+                cls.logger.error(f"{type(e).__name__}: {e}")
+                return JudgeResult(Status.CE, f"{type(e).__name__}: {e}", corpus_version=cls.corpus.version)
+            
+            if result is not None:
+                return result
+                
+            # The state built by setup is inherited by the processes of the test cases
+            if hasattr(Solver, "setup"):
+                return cls.setup_and_test(Solver, timings)
+                
+            return cls.test(Solver.solve, timings)
+    
+    
+    @classmethod
+    def check(cls, Solver: type) -> Optional[JudgeResult]:
+        """Check the Solver class against the example, return a Compile Error result if it does not match."""
         
         if not isinstance(Solver, type(ExampleSolver)):
             cls.logger.error(f"The type of Solver is {type(Solver)}, but it should be {type(ExampleSolver)}")
-            return Status.CE, "The type of Solver is {}, but it should be {}".format(type(Solver), type(ExampleSolver))
-        
-        for attr in ["solve"]:
+            return JudgeResult(Status.CE, "The type of Solver is {}, but it should be {}".format(type(Solver), type(ExampleSolver)), corpus_version=cls.corpus.version)
+    
+        for attr in ["solve", "setup"]:
+            if attr in OPTIONAL_METHODS and not hasattr(Solver, attr):
+                continue
+                
             if not hasattr(Solver, attr):
                 cls.logger.error(f"Solver does not have {attr} method")
-                return Status.CE, f"Solver does not have {attr} method"
-            
+                return JudgeResult(Status.CE, f"Solver does not have {attr} method", corpus_version=cls.corpus.version)
+        
             func = getattr(Solver, attr)
             if not isinstance(func, Callable):
                 cls.logger.error(f"{attr} is not Callable")
-                return Status.CE, f"{attr} is not Callable"
-            
+                return JudgeResult(Status.CE, f"{attr} is not Callable", corpus_version=cls.corpus.version)
+        
             sig = inspect.signature(func)
             example_sig = inspect.signature(getattr(ExampleSolver, attr))
             hints = get_type_hints(func)
             example_hints = get_type_hints(getattr(ExampleSolver, attr))
             
+            if len(sig.parameters) != len(example_sig.parameters):
+                cls.logger.error(f"{attr} takes {len(sig.parameters)} parameters, but it should take {len(example_sig.parameters)}")
+                return JudgeResult(Status.CE, f"{attr} takes {len(sig.parameters)} parameters, but it should take {len(example_sig.parameters)}", corpus_version=cls.corpus.version)
+        
             for (param_name, param), (example_param_name, example_param) in zip(sig.parameters.items(), example_sig.parameters.items()):
-                
+            
                 param_type = hints.get(param_name, None)
                 example_param_type = example_hints.get(example_param_name, None)
-                
+            
                 if param_name != example_param_name:
                     cls.logger.error(f"{param_name} does not match {example_param_name}")
-                    return Status.CE, f"{param_name} does not match {example_param_name}"
-                
+                    return JudgeResult(Status.CE, f"{param_name} does not match {example_param_name}", corpus_version=cls.corpus.version)
+            
                 if param_type is None:
                     cls.logger.error(f"{param_name} has no type hint")
-                    return Status.CE, f"{param_name} has no type hint"
-                
+                    return JudgeResult(Status.CE, f"{param_name} has no type hint", corpus_version=cls.corpus.version)
+            
                 if param_type != example_param_type:
                     cls.logger.error(f"{param_name} type hint does not match")
-                    return Status.CE, f"{param_name} type hint does not match"
-                
+                    return JudgeResult(Status.CE, f"{param_name} type hint does not match", corpus_version=cls.corpus.version)
+            
                 if param.default is not param.empty:
                     cls.logger.error(f"{param_name} has a default value")
-                    return Status.CE, f"{param_name} has a default value"
+                    return JudgeResult(Status.CE, f"{param_name} has a default value", corpus_version=cls.corpus.version)
+                    
+        return None
+    
+    
+    @classmethod
+    def setup_and_test(cls, Solver: type, timings: Optional[dict]=None) -> JudgeResult:
+        """Run Solver.setup and then test Solver.solve in one child process.
+        
+        The child is killed when setup exceeds SETUP_TIME_LIMIT, and it runs
+        with the memory limit. Without fork, setup runs in this process instead.
+        """
+        
+        if not hasattr(os, "fork"):
+            with Metrics.span(timings, "setup"):
+                result = cls.setup(Solver.setup)
+                
+            return result if result is not None else cls.test(Solver.solve, timings)
+        
+        def test() -> Tuple[JudgeResult, Optional[dict]]:
+            child_timings = Metrics.timings()
+            return cls.test(Solver.solve, child_timings), child_timings
+        
+        child = sandbox.SetupChild(Solver.setup, test, time_limit=SETUP_TIME_LIMIT, memory_limit=MEMORY_LIMIT)
+        
+        try:
+            with Metrics.span(timings, "setup"):
+                child.wait_setup()
                 
-        status = cls.test(Solver.solve)
+        except TimeoutError:
+            return JudgeResult(Status.TLE, "Time Limit Exceeded in setup", corpus_version=cls.corpus.version)
+        
+        except Exception as e:
+            return JudgeResult(Status.RE, f"Runtime Error in setup: {e}", corpus_version=cls.corpus.version)
+        
+        try:
+            result, child_timings = child.wait()
+            
+        except TimeoutError:
+            return JudgeResult(Status.TLE, "Time Limit Exceeded", corpus_version=cls.corpus.version)
+        
+        except Exception as e:
+            return JudgeResult(Status.RE, f"Runtime Error: {e}", corpus_version=cls.corpus.version)
         
-        return status
+        if timings is not None and child_timings is not None:
+            for name, value in child_timings.items():
+                timings[name] = timings.get(name, 0.0) + value
+                
+        return result
     
     
     @classmethod
-    def runner(cls, func: Callable, *args, **kwargs) -> Optional[Tuple[str, float]]:
-        """Run the function and return the status code and message."""
-         
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            future = executor.submit(func, *args, **kwargs)
+    def setup(cls, func: Callable) -> Optional[JudgeResult]:
+        """Run Solver.setup once in this process, return a result if it fails.
+        
+        It is limited to SETUP_TIME_LIMIT seconds with an alarm, which only works
+        on the main thread and which the submission can catch. Judge.setup_and_test
+        only falls back to it where fork is not available.
+        """
+        
+        def timeout(signum, frame):
+            raise TimeoutError()
             
-            try:
-                start_time = datetime.now()
-                result = future.result(timeout=TIME_LIMIT)
-                end_time = datetime.now()
-                elapsed_time = (end_time - start_time).total_seconds()  
-                return result, elapsed_time
+        alarm = threading.current_thread() is threading.main_thread()
+        
+        if alarm:
+            handler = signal.signal(signal.SIGALRM, timeout)
+            signal.setitimer(signal.ITIMER_REAL, SETUP_TIME_LIMIT)
             
-            except concurrent.futures.TimeoutError:
-                raise TimeoutError("Time Limit Exceeded")
+        try:
+            func()
+            
+        except TimeoutError:
+            return JudgeResult(Status.TLE, "Time Limit Exceeded in setup", corpus_version=cls.corpus.version)
         
+        except BaseException as e:
+            return JudgeResult(Status.RE, f"Runtime Error in setup: {type(e).__name__}: {e}", corpus_version=cls.corpus.version)
         
+        finally:
+            if alarm:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+                signal.signal(signal.SIGALRM, handler)
+                
+        return None
+    
+    
     @classmethod
-    def test(cls, func: Callable) -> Tuple[int, str]:
-        """Test the function and return the status code and message."""
+    def runner(cls, func: Callable, *args, **kwargs) -> Optional[RunResult]:
+        """Run the function in a sandboxed child process and return its result and resource usage."""
+         
+        return sandbox.run(func, *args, time_limit=TIME_LIMIT, memory_limit=MEMORY_LIMIT, **kwargs)
+        
+        
+    @classmethod
+    def run_cases(cls, func: Callable) -> Iterator[Union[RunResult, Exception]]:
+        """Run the function on every test case and yield the outcomes in order."""
+        
+        if PARALLEL_TEST_CASES:
+            yield from sandbox.run_many(
+                func,
+                ((Cube(cls.corpus.cube_size, cls.corpus.state(idx)),) for idx in range(len(cls.corpus))),
+                workers=PARALLEL_WORKERS or os.cpu_count(),
+                time_limit=TIME_LIMIT,
+                memory_limit=MEMORY_LIMIT,
+            )
+            return
+        
+        for idx in range(len(cls.corpus)):
+            try:
+                yield cls.runner(func, Cube(cls.corpus.cube_size, cls.corpus.state(idx)))
+            except Exception as e:
+                yield e
+        
+        
+    @classmethod
+    def test(cls, func: Callable, timings: Optional[dict]=None) -> JudgeResult:
+        """Test the function and return the result, the user solve and verify phases are timed into timings."""
         
         total_time = 0
+        total_cpu_time = 0
         total_steps = 0
         total_max_steps = 0
+        max_rss = 0
+        cases: List[CaseResult] = []
+        
+        outputs = cls.run_cases(func)
         
         # Test cases
         for idx, test_case in enumerate(cls.test_cases):
             
-            cube = Cube(CUBE_SIZE)
-            cube.rotate(test_case)
-            cls.cube.rotate(test_case)
-            total_max_steps += len(BasicSolver(cls.cube).solve())
+            with Metrics.span(timings, "user_solve"):
+                output = next(outputs)
+            
+            total_max_steps += int(cls.corpus.reference_steps[idx])
             
             try:
-                test_cube = Cube(CUBE_SIZE)
-                test_cube.rotate(test_case)
-                output = cls.runner(func, test_cube)
+                if isinstance(output, Exception):
+                    raise output
                 
                 if output is None:
-                    return Status.WA, f"Wrong Answer in test case {idx + 1}"
+                    return JudgeResult(Status.WA, f"Wrong Answer in test case {idx + 1}", cases, cls.corpus.version)
+                
+                result, elapsed_time, cpu_time, rss = output
                 
-                result, elapsed_time = output
+                # Wall time is distorted when the cases share the cores
+                if PARALLEL_TEST_CASES:
+                    elapsed_time = cpu_time
+                    
                 total_time += elapsed_time
+                total_cpu_time += cpu_time
+                max_rss = max(max_rss, rss)
                 
                 if not isinstance(result, str):
-                    return Status.WA, f"Wrong Answer in test case {idx + 1}: result is {type(result)}, but it should be str"
+                    return JudgeResult(Status.WA, f"Wrong Answer in test case {idx + 1}: result is {type(result)}, but it should be str", cases, cls.corpus.version)
                 
-                cls.logger.debug(cube)
-                cube.rotate(result)
-                cls.logger.debug(f"Test case {idx + 1}: \ntest_case: {test_case}\nresult: ({result})\ncube: {cube}\nelapsed time: {elapsed_time:.2f}s")
-                total_steps += len(result.split())
+                # Malformed moves raise CubeException, the steps are counted after cancellation
+                with Metrics.span(timings, "verify"):
+                    solved, steps = cls.verifier.verify_steps(cls.corpus.states[idx], result)
+                    
+                cls.logger.debug(f"Test case {idx + 1}: \ntest_case: {test_case}\nresult: ({result})\nsolved: {solved}\nsteps: {steps}\nelapsed time: {elapsed_time:.2f}s\ncpu time: {cpu_time:.2f}s\npeak rss: {rss / 1024:.1f}MiB")
+                total_steps += steps
                 
-                if not cube.is_done():
-                    return Status.WA, f"Wrong Answer in test case {idx + 1}: cube is not solved"
+                if not solved:
+                    return JudgeResult(Status.WA, f"Wrong Answer in test case {idx + 1}: cube is not solved", cases, cls.corpus.version)
+                
+                cases.append(CaseResult(elapsed_time, cpu_time, steps, int(cls.corpus.reference_steps[idx]), rss))
                 
             except CubeException as e:
-                return Status.WA, f"Wrong Answer in test case {idx + 1}: {e}"
+                return JudgeResult(Status.WA, f"Wrong Answer in test case {idx + 1}: {e}", cases, cls.corpus.version)
                 
             except TimeoutError:
-                return Status.TLE, f"Time Limit Exceeded in test case {idx + 1}"
+                return JudgeResult(Status.TLE, f"Time Limit Exceeded in test case {idx + 1}", cases, cls.corpus.version)
             
             except Exception as e:
-                return Status.RE, f"Runtime Error in test case {idx + 1}: {e}"
-            
-        cls.time = total_time
-        cls.steps = total_steps
-        cls.max_steps = total_max_steps
+                return JudgeResult(Status.RE, f"Runtime Error in test case {idx + 1}: {e}", cases, cls.corpus.version)
             
-        return Status.AC, f"Accepted {len(cls.test_cases)} test cases, time: {total_time:.2f}s, steps: {total_steps:.2f}"
+        return JudgeResult(Status.AC, f"Accepted {len(cls.test_cases)} test cases, time: {total_time:.2f}s, cpu time: {total_cpu_time:.2f}s, memory: {max_rss / 1024:.1f}MiB, steps: {total_steps:.2f}", cases, cls.corpus.version)
     
     
     @classmethod
-    def record(cls, username: str) -> None:
-        """Record the score."""
-        
-        def score() -> float:
-            """Calculate the score."""
-            return math.exp(-cls.time / TIME_LIMIT) * 50 + math.exp(-cls.steps / cls.max_steps) * 50
-        
-        if username not in cls.ranklist:
-            cls.ranklist[username] = score()
-            
-        elif cls.ranklist[username] > score():
-            cls.ranklist[username] = score()
-        
-        cls.ranklist = dict(sorted(cls.ranklist.items(), key=lambda item: item[1]))
-        
+    def verify(cls, solutions: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """Verify one solution per test case in a single batch and return the solved mask and step counts."""
         
+        return cls.verifier.verify_batch(cls.corpus.states, solutions)
+    
+    
     @classmethod
-    def reset(cls) -> None:
-        """Reset the Judge class."""
+    def record(cls, username: str, score: float) -> None:
+        """Record the score."""
         
-        cls.time = 0
-        cls.steps = 0
-        cls.max_steps = 0
-        cls.cube.reset()
\ No newline at end of file
+        cls.ranklist.update(username, score)
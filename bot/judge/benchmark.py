@@ -0,0 +1,250 @@
+"""Throughput and latency benchmark of the judge.
+
+Usage:
+    python -m bot.judge.benchmark [--seed 0] [--cases 10] [--repeat 3] [--solvers example,basic,slow,infinite] [--output bench.json]
+
+Every run builds the same corpus from the seed, judges each reference solver
+`repeat` times with Judge.judge and reports submissions/sec, verdict latency
+percentiles, a per-phase breakdown and peak memory as JSON, so the output of
+two commits can be diffed.
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from bot.config import TIME_LIMIT, SCRAMBLE_LENGTH
+from bot.judge import Judge, Status
+from bot.judge.corpus import TestCorpus
+from bot.judge.loader import SubmissionLoader
+from bot.judge.twophase import TwoPhaseSolver
+
+
+log = logging.getLogger(__name__)
+
+BASIC_SOLVER = b'''from magiccube import Cube
+from magiccube.solver.basic.basic_solver import BasicSolver
+
+class Solver:
+
+    def solve(cube: Cube) -> str:
+
+        return " ".join(str(move) for move in BasicSolver(cube).solve())
+'''
+
+SLOW_SOLVER = BASIC_SOLVER.replace(b"class Solver:", b"import time\n\nclass Solver:").replace(
+    b"        return",
+    b"        deadline = time.perf_counter() + %.3f\n        while time.perf_counter() < deadline:\n            pass\n\n        return" % (TIME_LIMIT / 5),
+)
+
+INFINITE_SOLVER = b'''from magiccube import Cube
+
+class Solver:
+
+    def solve(cube: Cube) -> str:
+
+        while True:
+            pass
+'''
+
+with open(os.path.join(os.path.dirname(__file__), "example.py"), "rb") as f:
+    EXAMPLE_SOLVER = f.read()
+
+SOLVERS: Dict[str, bytes] = {
+    "example": EXAMPLE_SOLVER,
+    "basic": BASIC_SOLVER,
+    "slow": SLOW_SOLVER,
+    "infinite": INFINITE_SOLVER,
+}
+
+STATUS_NAMES = {Status.AC: "AC", Status.WA: "WA", Status.TLE: "TLE", Status.RE: "RE", Status.CE: "CE"}
+
+
+def build_corpus(seed: int, cases: int) -> Dict:
+    """Generate the seeded 3x3 corpus and time the reference solver on it."""
+
+    random.seed(seed)
+    corpus = TestCorpus.generate(count=cases, length=SCRAMBLE_LENGTH, cube_size=3)
+
+    solver = TwoPhaseSolver.get()
+    start = time.perf_counter()
+
+    for idx in range(len(corpus)):
+        solver.solve(corpus.states[idx])
+
+    reference_time = time.perf_counter() - start
+
+    return {"corpus": corpus, "reference_time": reference_time}
+
+
+def phases(file: bytes) -> Dict[str, float]:
+    """Time every phase of judging one file separately, stopping where Judge.test would."""
+
+    timings = {"load": 0.0, "signature": 0.0, "setup": 0.0, "user_solve": 0.0, "verify": 0.0}
+
+    with SubmissionLoader(file=file) as loader:
+        start = time.perf_counter()
+        Solver = loader.load().Solver
+        timings["load"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        result = Judge.check(Solver)
+        timings["signature"] = time.perf_counter() - start
+
+        if result is not None:
+            return timings
+
+        if hasattr(Solver, "setup"):
+            start = time.perf_counter()
+            result = Judge.setup(Solver.setup)
+            timings["setup"] = time.perf_counter() - start
+
+            if result is not None:
+                return timings
+
+        outputs = Judge.run_cases(Solver.solve)
+
+        for idx in range(len(Judge.corpus)):
+            start = time.perf_counter()
+            output = next(outputs)
+            timings["user_solve"] += time.perf_counter() - start
+
+            if isinstance(output, Exception) or output is None or not isinstance(output.result, str):
+                break
+
+            start = time.perf_counter()
+            solved = Judge.verifier.verify(Judge.corpus.states[idx], output.result)
+            timings["verify"] += time.perf_counter() - start
+
+            if not solved:
+                break
+
+        outputs.close()
+
+    return timings
+
+
+def percentiles(latencies: List[float]) -> Dict[str, float]:
+
+    if not latencies:
+        return {"p50": None, "p95": None, "p99": None, "mean": None}
+
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+
+    return {"p50": float(p50), "p95": float(p95), "p99": float(p99), "mean": float(np.mean(latencies))}
+
+
+def commit() -> str:
+
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=os.path.dirname(__file__), capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(seed: int=0, cases: int=10, repeat: int=3, solvers: List[str]=None) -> Dict:
+    """Run the benchmark and return the report."""
+
+    solvers = solvers or list(SOLVERS)
+    setup = build_corpus(seed, cases)
+    Judge.init(setup["corpus"])
+
+    report = {
+        "commit": commit(),
+        "python": platform.python_version(),
+        "seed": seed,
+        "cases": cases,
+        "repeat": repeat,
+        "time_limit": TIME_LIMIT,
+        "corpus_version": Judge.corpus.version,
+        "reference_solve": setup["reference_time"],
+        "solvers": {},
+    }
+
+    all_latencies = []
+    total_start = time.perf_counter()
+
+    for name in solvers:
+        file = SOLVERS[name]
+        latencies = []
+        verdicts = {}
+        peak_rss = None
+
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = Judge.judge(file)
+            latencies.append(time.perf_counter() - start)
+
+            verdict = STATUS_NAMES[result.status]
+            verdicts[verdict] = verdicts.get(verdict, 0) + 1
+
+            if result.cases:
+                peak_rss = max(peak_rss or 0, max(case.rss for case in result.cases))
+
+        all_latencies += latencies
+        elapsed = sum(latencies)
+
+        report["solvers"][name] = {
+            "verdicts": verdicts,
+            "submissions_per_sec": repeat / elapsed if elapsed else None,
+            "latency": percentiles(latencies),
+            "phases": phases(file),
+            # Only known for solvers which pass at least one case
+            "peak_rss_kib": peak_rss,
+        }
+
+        log.info(f"{name}: {verdicts}, p50 {report['solvers'][name]['latency']['p50']:.3f}s")
+
+    total = time.perf_counter() - total_start
+
+    report["submissions_per_sec"] = len(all_latencies) / total
+    report["latency"] = percentiles(all_latencies)
+    report["peak_memory_kib"] = {
+        "judge": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "solvers": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    }
+
+    return report
+
+
+def main() -> None:
+
+    parser = argparse.ArgumentParser(description="Benchmark the judge with reproducible workloads.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--cases", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--solvers", type=lambda value: value.split(","), default=list(SOLVERS), help=f"comma separated subset of {','.join(SOLVERS)}")
+    parser.add_argument("--output", help="write the JSON report to this file instead of stdout")
+    args = parser.parse_args()
+
+    unknown = set(args.solvers) - set(SOLVERS)
+
+    if unknown:
+        parser.error(f"unknown solvers: {', '.join(sorted(unknown))}")
+
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+    logging.getLogger("bot.judge").setLevel(logging.WARNING)
+    log.setLevel(logging.INFO)
+
+    report = run(seed=args.seed, cases=args.cases, repeat=args.repeat, solvers=args.solvers)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=4)
+    else:
+        json.dump(report, sys.stdout, indent=4)
+        print()
+
+
+if __name__ == "__main__":
+    main()
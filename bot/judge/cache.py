@@ -0,0 +1,97 @@
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Callable, Optional
+
+from bot.config import TIME_LIMIT, MEMORY_LIMIT, SETUP_TIME_LIMIT, STEP_METRIC, VERDICT_CACHE_SIZE
+from bot.judge.result import JudgeResult, Status
+
+
+log = logging.getLogger(__name__)
+
+# Verdicts which do not depend on the load of the machine
+CACHEABLE = (Status.AC, Status.WA, Status.CE)
+
+
+class VerdictCache:
+    """Bounded LRU of verdicts keyed by the content of the submission and the corpus.
+
+    Misses fall back to a loader, normally the submissions stored in the
+    database, so the cache survives restarts. The corpus version and the limits
+    and step metric of the judge are part of the key, so a rotated corpus or a
+    changed setting never matches an old verdict.
+    """
+
+    max_size = VERDICT_CACHE_SIZE
+    entries: "OrderedDict[str, JudgeResult]" = OrderedDict()
+    loader: Callable[[str], Optional[JudgeResult]] = None
+
+    # Metrics
+    hits = 0
+    misses = 0
+
+    @classmethod
+    def init(cls, loader: Callable[[str], Optional[JudgeResult]]=None, max_size: int=VERDICT_CACHE_SIZE) -> None:
+
+        cls.loader = loader
+        cls.max_size = max_size
+        cls.clear()
+
+
+    @staticmethod
+    def key(file: bytes, data: bytes, data_filename: str, corpus_version: str, time_limit: float=TIME_LIMIT,
+            memory_limit: int=MEMORY_LIMIT, setup_time_limit: float=SETUP_TIME_LIMIT, step_metric: str=STEP_METRIC) -> str:
+        """SHA-256 of the source, the data file, the corpus version and every setting a verdict or score depends on."""
+
+        sha = hashlib.sha256()
+        settings = (repr(float(time_limit)), repr(memory_limit), repr(float(setup_time_limit)), step_metric)
+
+        # Length prefixes keep the fields from running into each other
+        for field in (file, data or b"", (data_filename or "").encode(), corpus_version.encode(), *(setting.encode() for setting in settings)):
+            sha.update(len(field).to_bytes(8, "little"))
+            sha.update(field)
+
+        return sha.hexdigest()
+
+
+    @classmethod
+    async def get(cls, key: str) -> Optional[JudgeResult]:
+        """Return the cached verdict, looking it up with the loader in a thread on a miss."""
+
+        if key in cls.entries:
+            cls.entries.move_to_end(key)
+            cls.hits += 1
+            return cls.entries[key]
+
+        result = await asyncio.to_thread(cls.loader, key) if cls.loader is not None else None
+
+        if result is None:
+            cls.misses += 1
+            return None
+
+        cls.hits += 1
+        cls.put(key, result)
+
+        return result
+
+
+    @classmethod
+    def put(cls, key: str, result: JudgeResult) -> None:
+
+        if result.status not in CACHEABLE:
+            return
+
+        cls.entries[key] = result
+        cls.entries.move_to_end(key)
+
+        while len(cls.entries) > cls.max_size:
+            cls.entries.popitem(last=False)
+
+
+    @classmethod
+    def clear(cls) -> None:
+        """Drop the verdicts in memory, e.g. after the corpus rotated."""
+
+        cls.entries.clear()
+        log.debug("Verdict cache cleared.")
@@ -0,0 +1,241 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+from typing import List
+
+import numpy as np
+from magiccube import Cube
+
+from bot.config import CUBE_SIZE, CORPUS_DIR, TEST_CASES, SCRAMBLE_LENGTH, STEP_METRIC
+from bot.judge.metrics import Metrics
+
+
+log = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+
+# Color codes used by the state arrays, in the order of magiccube's Color enum
+COLORS = "ROWYBG"
+COLOR_CODE = {color: code for code, color in enumerate(COLORS)}
+
+# Color code of every ASCII byte, 255 for bytes which are not a color
+COLOR_LOOKUP = np.full(256, 255, dtype=np.uint8)
+COLOR_LOOKUP[np.frombuffer(COLORS.encode(), dtype=np.uint8)] = np.arange(len(COLORS))
+
+
+class TestCorpus:
+    """A fixed set of test cases stored on disk under a content hash.
+
+    Layout of a corpus directory:
+        meta.json           format, cube size, version and scrambles
+        states.npy          (N, 6*n*n) uint8 color codes of the scrambled cubes
+        reference_steps.npy (N,) int32 step counts of the reference solutions
+
+    The arrays are memory-mapped on load, and the CURRENT file next to the
+    corpus directories names the active version.
+    """
+
+    def __init__(self, cube_size: int, scrambles: List[str], states: np.ndarray, reference_steps: np.ndarray, path: str=None) -> None:
+        self.cube_size = cube_size
+        self.scrambles = scrambles
+        self.states = states
+        self.reference_steps = reference_steps
+        self.path = path
+        self.version = self.compute_version()
+
+
+    def __len__(self) -> int:
+
+        return len(self.scrambles)
+
+
+    def state(self, idx: int) -> str:
+        """Return the scrambled state of a test case in magiccube format."""
+
+        return decode_state(self.states[idx])
+
+
+    def compute_version(self) -> str:
+        """Hash of the content of the corpus."""
+
+        sha = hashlib.sha256()
+        sha.update(f"{FORMAT_VERSION}:{self.cube_size}:".encode())
+        sha.update("\n".join(self.scrambles).encode())
+        sha.update(np.ascontiguousarray(self.states, dtype=np.uint8).tobytes())
+        sha.update(np.ascontiguousarray(self.reference_steps, dtype=np.int32).tobytes())
+
+        return sha.hexdigest()[:16]
+
+
+    @classmethod
+    def generate(cls, count: int=TEST_CASES, length: int=SCRAMBLE_LENGTH, cube_size: int=CUBE_SIZE) -> "TestCorpus":
+        """Generate new random scrambles and solve them with the reference solver.
+
+        3x3 cubes are solved with the two-phase solver and its solutions are
+        counted in STEP_METRIC like the submissions are. There is no reference
+        solver for other sizes, the scramble length is used instead.
+        """
+
+        # Both import this module
+        from bot.judge.twophase import TwoPhaseSolver
+        from bot.judge.verifier import Verifier
+
+        scrambles = []
+        states = np.zeros((count, 6 * cube_size * cube_size), dtype=np.uint8)
+        reference_steps = np.full(count, length, dtype=np.int32)
+
+        solver = TwoPhaseSolver.get() if cube_size == 3 else None
+        verifier = Verifier(cube_size, STEP_METRIC) if solver is not None else None
+
+        if solver is None:
+            log.warning(f"There is no reference solver for size {cube_size}, using the scramble length instead.")
+
+        for idx in range(count):
+            cube = Cube(cube_size)
+            scramble = " ".join(str(move) for move in cube.generate_random_moves(length))
+            cube.rotate(scramble)
+
+            scrambles.append(scramble)
+            states[idx] = encode_state(cube.get())
+
+            if solver is None:
+                continue
+
+            try:
+                start = time.perf_counter()
+                reference_steps[idx] = verifier.steps(verifier.parse(solver.solve(states[idx])))
+                Metrics.observe("reference_solve", time.perf_counter() - start)
+
+            except Exception as e:
+                log.warning(f"Reference solver failed ({e}), using the scramble length instead.")
+
+        log.info(f"Generated a test corpus of {count} cases.")
+
+        return cls(cube_size, scrambles, states, reference_steps)
+
+
+    def save(self, directory: str=CORPUS_DIR) -> str:
+        """Write the corpus under directory/<version> and return its path."""
+
+        path = os.path.join(directory, self.version)
+
+        if os.path.exists(path):
+            self.path = path
+            return path
+
+        os.makedirs(directory, exist_ok=True)
+        tmp = tempfile.mkdtemp(prefix=".tmp-", dir=directory)
+
+        try:
+            np.save(os.path.join(tmp, "states.npy"), np.ascontiguousarray(self.states, dtype=np.uint8))
+            np.save(os.path.join(tmp, "reference_steps.npy"), np.ascontiguousarray(self.reference_steps, dtype=np.int32))
+
+            with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+                json.dump({
+                    "format": FORMAT_VERSION,
+                    "version": self.version,
+                    "cube_size": self.cube_size,
+                    "count": len(self),
+                    "scrambles": self.scrambles,
+                }, f)
+
+            os.replace(tmp, path)
+
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+        self.path = path
+        log.info(f"Saved test corpus {self.version} to {path}")
+
+        return path
+
+
+    @classmethod
+    def load(cls, path: str) -> "TestCorpus":
+        """Load a corpus directory, the arrays are memory-mapped."""
+
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+
+        if meta["format"] != FORMAT_VERSION:
+            raise ValueError(f"Unsupported corpus format {meta['format']} in {path}")
+
+        corpus = cls(
+            cube_size=meta["cube_size"],
+            scrambles=meta["scrambles"],
+            states=np.load(os.path.join(path, "states.npy"), mmap_mode="r"),
+            reference_steps=np.load(os.path.join(path, "reference_steps.npy"), mmap_mode="r"),
+            path=path,
+        )
+
+        if corpus.version != meta["version"]:
+            raise ValueError(f"Corpus {path} is corrupted: version {meta['version']} does not match its content {corpus.version}")
+
+        return corpus
+
+
+    def activate(self, directory: str=CORPUS_DIR) -> None:
+        """Make this corpus the one loaded at startup."""
+
+        if self.path is None:
+            self.save(directory)
+
+        tmp = os.path.join(directory, ".CURRENT.tmp")
+
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(self.version)
+
+        os.replace(tmp, os.path.join(directory, "CURRENT"))
+
+        log.info(f"Activated test corpus {self.version}")
+
+
+    @classmethod
+    def current(cls, directory: str=CORPUS_DIR, cube_size: int=CUBE_SIZE) -> "TestCorpus":
+        """Load the active corpus, or generate one when there is none for this cube size."""
+
+        try:
+            with open(os.path.join(directory, "CURRENT"), "r", encoding="utf-8") as f:
+                corpus = cls.load(os.path.join(directory, f.read().strip()))
+
+            if corpus.cube_size == cube_size:
+                return corpus
+
+            log.warning(f"Active test corpus {corpus.version} is for size {corpus.cube_size}, generating a new one.")
+
+        except FileNotFoundError:
+            log.info("No test corpus found, generating a new one.")
+
+        return cls.rotate(directory=directory, cube_size=cube_size)
+
+
+    @classmethod
+    def rotate(cls, directory: str=CORPUS_DIR, cube_size: int=CUBE_SIZE) -> "TestCorpus":
+        """Generate, save and activate a new corpus."""
+
+        corpus = cls.generate(cube_size=cube_size)
+        corpus.save(directory)
+        corpus.activate(directory)
+
+        return corpus
+
+
+def encode_state(state: str) -> np.ndarray:
+    """Convert a magiccube state string to an array of color codes."""
+
+    codes = COLOR_LOOKUP[np.frombuffer(state.encode("latin-1", errors="replace"), dtype=np.uint8)]
+
+    if (codes == 255).any():
+        raise ValueError(f"Invalid colors in state {state}")
+
+    return codes
+
+
+def decode_state(state: np.ndarray) -> str:
+    """Convert an array of color codes to a magiccube state string."""
+
+    return "".join(COLORS[code] for code in state)
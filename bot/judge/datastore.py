@@ -0,0 +1,214 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import stat
+import tempfile
+from typing import Dict, Optional
+
+import numpy as np
+
+from bot.config import DATA_DIR
+
+
+log = logging.getLogger(__name__)
+
+READ_ONLY = stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH
+
+# Keys of a JSON object which may become file names
+SAFE_KEY = re.compile(r"^[A-Za-z0-9_\-]{1,64}$")
+
+# The files of an entry are kept apart from its manifest, so no upload can replace it
+FILES = "files"
+MANIFEST = "manifest.json"
+
+
+class DataStore:
+    """Uploaded data files stored once by content, shared read-only by the judge workers.
+
+    Layout of an entry, DATA_DIR/<sha256 of the name and content>/:
+        files/<name>.json        the uploaded file
+        files/<stem>.npy         the file as an array, when it is a numeric JSON array
+        files/<stem>.<key>.npy   one array per key, when it is an object of numeric arrays
+
+        manifest.json            size and mtime of every file in files/
+
+    A submission sees the files of its entry next to its module as read-only
+    symlinks, so np.load(..., mmap_mode="r") shares the pages of the tables
+    between all workers and resubmissions instead of parsing the JSON again.
+    The permissions only hold when the bot does not run as root, so an entry
+    whose files no longer match its manifest is stored again.
+    """
+
+    directory = DATA_DIR
+
+    @staticmethod
+    def key(data: bytes, data_filename: str) -> str:
+
+        sha = hashlib.sha256()
+        sha.update(os.path.basename(data_filename).encode())
+        sha.update(b"\0")
+        sha.update(data)
+
+        return sha.hexdigest()
+
+
+    @classmethod
+    def path(cls, key: str) -> str:
+
+        return os.path.join(cls.directory, key)
+
+
+    @classmethod
+    def put(cls, data: bytes, data_filename: str) -> str:
+        """Store the file unless it is stored already and return the directory of its entry."""
+
+        path = os.path.abspath(cls.path(cls.key(data, data_filename)))
+
+        if os.path.isdir(path):
+            if cls.intact(path):
+                return path
+
+            log.warning(f"Data file entry {path} was modified, storing it again.")
+            os.chmod(path, stat.S_IRWXU)
+
+            if os.path.isdir(cls.files(path)):
+                os.chmod(cls.files(path), stat.S_IRWXU)
+
+            shutil.rmtree(path)
+
+        os.makedirs(cls.directory, exist_ok=True)
+        tmp = tempfile.mkdtemp(prefix=".tmp-", dir=cls.directory)
+        files = cls.files(tmp)
+
+        try:
+            filename = os.path.basename(data_filename)
+            os.mkdir(files)
+
+            with open(os.path.join(files, filename), "wb") as f:
+                f.write(data)
+
+            arrays = cls.convert(data)
+
+            for name, array in arrays.items():
+                np.save(os.path.join(files, f"{os.path.splitext(filename)[0]}{name}.npy"), array)
+
+            manifest = {}
+
+            for entry in os.listdir(files):
+                os.chmod(os.path.join(files, entry), READ_ONLY)
+                manifest[entry] = cls.signature(os.path.join(files, entry))
+
+            with open(os.path.join(tmp, MANIFEST), "w", encoding="utf-8") as f:
+                json.dump(manifest, f)
+
+            os.chmod(os.path.join(tmp, MANIFEST), READ_ONLY)
+
+            for directory in (files, tmp):
+                os.chmod(directory, READ_ONLY | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+
+            try:
+                os.replace(tmp, path)
+            except OSError:
+                # Another process stored the same entry in the meantime
+                if not os.path.isdir(path):
+                    raise
+
+        finally:
+            if os.path.isdir(tmp):
+                os.chmod(tmp, stat.S_IRWXU)
+
+                if os.path.isdir(files):
+                    os.chmod(files, stat.S_IRWXU)
+
+                shutil.rmtree(tmp, ignore_errors=True)
+
+        log.info(f"Stored data file {data_filename} ({len(data)} bytes, {len(arrays)} arrays) at {path}")
+
+        return path
+
+
+    @staticmethod
+    def files(path: str) -> str:
+        """Return the directory of the files which a submission sees of the entry at path."""
+
+        return os.path.join(path, FILES)
+
+
+    @staticmethod
+    def signature(path: str) -> list:
+
+        info = os.stat(path)
+
+        return [info.st_size, info.st_mtime_ns]
+
+
+    @classmethod
+    def intact(cls, path: str) -> bool:
+        """Return True if the files of an entry still match its manifest."""
+
+        try:
+            with open(os.path.join(path, MANIFEST), "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+
+            files = cls.files(path)
+
+            return sorted(os.listdir(files)) == sorted(manifest) and all(cls.signature(os.path.join(files, entry)) == value for entry, value in manifest.items())
+
+        except (OSError, ValueError):
+            return False
+
+
+    @classmethod
+    def get(cls, key: str) -> Optional[str]:
+        """Return the directory of a stored entry, None if there is none."""
+
+        path = cls.path(key)
+
+        return path if os.path.isdir(path) else None
+
+
+    @staticmethod
+    def convert(data: bytes) -> Dict[str, np.ndarray]:
+        """Return the numeric arrays of a JSON file keyed by file name suffix, empty if it has none."""
+
+        try:
+            content = json.loads(data)
+        except (UnicodeDecodeError, ValueError):
+            return {}
+
+        if isinstance(content, list):
+            array = to_array(content)
+            return {"": array} if array is not None else {}
+
+        if isinstance(content, dict):
+            arrays = {}
+
+            for key, value in content.items():
+                array = to_array(value) if isinstance(value, list) and SAFE_KEY.match(key) else None
+
+                if array is not None:
+                    arrays[f".{key}"] = array
+
+            return arrays
+
+        return {}
+
+
+def to_array(value: list) -> Optional[np.ndarray]:
+    """Convert a rectangular list of numbers to the smallest array which holds it, None for anything else."""
+
+    try:
+        array = np.asarray(value)
+    except ValueError:
+        return None
+
+    if array.size == 0 or array.dtype.kind not in "biuf":
+        return None
+
+    if array.dtype.kind in "iu":
+        array = array.astype(np.result_type(np.min_scalar_type(array.min()), np.min_scalar_type(array.max())))
+
+    return array
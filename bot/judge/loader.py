@@ -0,0 +1,85 @@
+import importlib.util
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import uuid
+from types import ModuleType
+
+from bot.judge.datastore import DataStore
+
+
+log = logging.getLogger(__name__)
+
+
+class SubmissionLoader:
+    """Load a submission as its own module from its own temporary directory.
+
+    The data file is either written from data, or the files of a DataStore
+    entry at data_path are linked next to the module.
+    """
+
+    def __init__(self, file: bytes, data: bytes=None, data_filename: str=None, data_path: str=None) -> None:
+        self.file = file
+        self.data = data
+        self.data_filename = data_filename
+        self.data_path = data_path
+        self.name = f"submission_{uuid.uuid4().hex}"
+        self.path: str = None
+        self.module: ModuleType = None
+
+
+    def __enter__(self) -> "SubmissionLoader":
+
+        self.path = tempfile.mkdtemp(prefix="submission-")
+
+        with open(os.path.join(self.path, "__init__.py"), "wb") as f:
+            f.write(self.file)
+
+        if self.data and self.data_filename:
+            with open(os.path.join(self.path, os.path.basename(self.data_filename)), "wb") as f:
+                f.write(self.data)
+
+        if self.data_path:
+            files = DataStore.files(self.data_path)
+
+            for entry in os.listdir(files):
+                os.symlink(os.path.abspath(os.path.join(files, entry)), os.path.join(self.path, entry))
+
+        return self
+
+
+    def __exit__(self, *exc) -> None:
+
+        self.cleanup()
+
+
+    def load(self) -> ModuleType:
+        """Execute the submission and return its module."""
+
+        spec = importlib.util.spec_from_file_location(
+            self.name,
+            os.path.join(self.path, "__init__.py"),
+            submodule_search_locations=[self.path],
+        )
+        self.module = importlib.util.module_from_spec(spec)
+
+        # Registered so that pickling objects defined by the submission works while it is judged.
+        sys.modules[self.name] = self.module
+        spec.loader.exec_module(self.module)
+
+        return self.module
+
+
+    def cleanup(self) -> None:
+        """Forget the module and remove the temporary directory."""
+
+        for name in [name for name in sys.modules if name == self.name or name.startswith(self.name + ".")]:
+            del sys.modules[name]
+
+        self.module = None
+
+        if self.path is not None:
+            shutil.rmtree(self.path, ignore_errors=True)
+            self.path = None
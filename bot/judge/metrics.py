@@ -0,0 +1,198 @@
+import asyncio
+import contextlib
+import logging
+import os
+import time
+from collections import deque
+from typing import Callable, ContextManager, Deque, Dict, Optional
+
+import numpy as np
+
+from bot.config import METRICS_ENABLED, METRICS_WINDOW, METRICS_FILE, METRICS_DUMP_INTERVAL
+
+
+log = logging.getLogger(__name__)
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+# Shared no-op span, so a disabled span costs one attribute check
+_NULL_SPAN = contextlib.nullcontext()
+
+
+class _Span:
+    """Add the time spent in the block to timings[name]."""
+
+    __slots__ = ("timings", "name", "start")
+
+    def __init__(self, timings: Dict[str, float], name: str) -> None:
+        self.timings = timings
+        self.name = name
+
+
+    def __enter__(self) -> None:
+        self.start = time.perf_counter()
+
+
+    def __exit__(self, *exc) -> None:
+        self.timings[self.name] = self.timings.get(self.name, 0.0) + time.perf_counter() - self.start
+
+
+class Metrics:
+    """Rolling histograms of judge phases and gauges of the queue and workers.
+
+    The judge workers time their phases into a plain dict carried back on the
+    JudgeResult, and the bot process folds it into one window of the latest
+    METRICS_WINDOW samples per phase. Gauges are callbacks registered by the
+    components which own the values.
+    """
+
+    enabled = METRICS_ENABLED
+    window = METRICS_WINDOW
+    samples: Dict[str, Deque[float]] = {}
+    counts: Dict[str, int] = {}
+    sums: Dict[str, float] = {}
+    gauges: Dict[str, Callable[[], float]] = {}
+    task: asyncio.Task = None
+
+    @classmethod
+    def span(cls, timings: Optional[Dict[str, float]], name: str) -> ContextManager:
+        """Time a block into timings, a no-op when metrics are disabled or timings is None."""
+
+        if not cls.enabled or timings is None:
+            return _NULL_SPAN
+
+        return _Span(timings, name)
+
+
+    @classmethod
+    def timings(cls) -> Optional[Dict[str, float]]:
+        """A fresh dict to collect spans in, None when metrics are disabled."""
+
+        return {} if cls.enabled else None
+
+
+    @classmethod
+    def observe(cls, name: str, value: float) -> None:
+
+        if not cls.enabled:
+            return
+
+        if name not in cls.samples:
+            cls.samples[name] = deque(maxlen=cls.window)
+            cls.counts[name] = 0
+            cls.sums[name] = 0.0
+
+        cls.samples[name].append(value)
+        cls.counts[name] += 1
+        cls.sums[name] += value
+
+
+    @classmethod
+    def record(cls, timings: Optional[Dict[str, float]]) -> None:
+        """Fold the spans of one judge into the histograms."""
+
+        for name, value in (timings or {}).items():
+            cls.observe(name, value)
+
+
+    @classmethod
+    def gauge(cls, name: str, callback: Callable[[], float]) -> None:
+        """Register a gauge read every time the metrics are reported."""
+
+        cls.gauges[name] = callback
+
+
+    @classmethod
+    def summary(cls) -> Dict[str, dict]:
+        """Count, mean and quantiles of the window of every phase."""
+
+        summary = {}
+
+        for name, samples in cls.samples.items():
+            values = np.fromiter(samples, dtype=np.float64, count=len(samples))
+            summary[name] = {
+                "count": cls.counts[name],
+                "sum": cls.sums[name],
+                "mean": float(values.mean()) if len(values) else 0.0,
+                **{f"p{int(q * 100)}": float(value) for q, value in zip(QUANTILES, np.quantile(values, QUANTILES) if len(values) else [0.0] * len(QUANTILES))},
+            }
+
+        return summary
+
+
+    @classmethod
+    def read_gauges(cls) -> Dict[str, float]:
+
+        values = {}
+
+        for name, callback in cls.gauges.items():
+            try:
+                values[name] = float(callback())
+            except Exception:
+                log.warning(f"Failed to read gauge {name}", exc_info=True)
+
+        return values
+
+
+    @classmethod
+    def prometheus(cls) -> str:
+        """Render the metrics in the Prometheus text exposition format."""
+
+        lines = [
+            "# HELP judge_phase_seconds Time spent in each phase of judging, over the latest samples.",
+            "# TYPE judge_phase_seconds summary",
+        ]
+
+        for name, stats in cls.summary().items():
+            for q in QUANTILES:
+                lines.append(f'judge_phase_seconds{{phase="{name}",quantile="{q}"}} {stats[f"p{int(q * 100)}"]}')
+
+            lines.append(f'judge_phase_seconds_sum{{phase="{name}"}} {stats["sum"]}')
+            lines.append(f'judge_phase_seconds_count{{phase="{name}"}} {stats["count"]}')
+
+        for name, value in cls.read_gauges().items():
+            lines.append(f"# TYPE judge_{name} gauge")
+            lines.append(f"judge_{name} {value}")
+
+        return "\n".join(lines) + "\n"
+
+
+    @classmethod
+    def dump(cls, path: str=METRICS_FILE) -> None:
+        """Write the Prometheus text to path atomically, for the node exporter textfile collector."""
+
+        cls.write(cls.prometheus(), path)
+
+
+    @staticmethod
+    def write(text: str, path: str=METRICS_FILE) -> None:
+
+        tmp = f"{path}.tmp"
+
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(text)
+
+        os.replace(tmp, path)
+
+
+    @classmethod
+    def start(cls) -> None:
+        """Dump the metrics every METRICS_DUMP_INTERVAL seconds when METRICS_FILE is set."""
+
+        if not cls.enabled or not METRICS_FILE or (cls.task is not None and not cls.task.done()):
+            return
+
+        cls.task = asyncio.create_task(cls._dump_loop())
+
+
+    @classmethod
+    async def _dump_loop(cls) -> None:
+
+        while True:
+            await asyncio.sleep(METRICS_DUMP_INTERVAL)
+
+            # The samples are appended to on the loop, so the text is built here and only written in a thread
+            try:
+                await asyncio.to_thread(cls.write, cls.prometheus(), METRICS_FILE)
+            except Exception:
+                log.warning(f"Failed to write metrics to {METRICS_FILE}", exc_info=True)
@@ -0,0 +1,222 @@
+import asyncio
+import concurrent.futures
+import logging
+import multiprocessing
+import time
+from concurrent.futures.process import BrokenProcessPool
+
+from bot.config import JUDGE_WORKERS, JUDGE_TIMEOUT, JUDGE_START_METHOD
+from bot.judge import Judge, JudgeResult, Status
+from bot.judge.corpus import TestCorpus
+from bot.judge.datastore import DataStore
+from bot.judge.metrics import Metrics
+
+
+log = logging.getLogger(__name__)
+
+# Imported once by the forkserver, every worker is forked with them already loaded
+PRELOAD = ["numpy", "magiccube", "magiccube.solver.basic.basic_solver", "bot.judge"]
+
+
+def _init_worker(corpus_path: str) -> None:
+    """Initialize the Judge inside a worker process."""
+
+    Judge.init(TestCorpus.load(corpus_path))
+
+
+def _judge_worker(file: bytes, data_path: str=None) -> JudgeResult:
+    """Judge the file inside a worker process, the data file is read from its DataStore entry.
+
+    Only a JudgeResult leaves the worker, a SystemExit or KeyboardInterrupt of the
+    submission would otherwise be raised again in the bot process.
+    """
+
+    try:
+        return Judge.judge(file=file, data_path=data_path)
+
+    except BaseException as e:
+        log.error("Judge failed inside the worker.", exc_info=True)
+        return JudgeResult(Status.RE, f"Runtime Error: {type(e).__name__}: {e}", corpus_version=Judge.corpus.version)
+
+
+def _context() -> multiprocessing.context.BaseContext:
+    """Return the multiprocessing context of JUDGE_START_METHOD, falling back to the default one."""
+
+    if JUDGE_START_METHOD not in multiprocessing.get_all_start_methods():
+        log.warning(f"Start method {JUDGE_START_METHOD} is not available, using {multiprocessing.get_start_method()}.")
+        return multiprocessing.get_context()
+
+    context = multiprocessing.get_context(JUDGE_START_METHOD)
+
+    if JUDGE_START_METHOD == "forkserver":
+        context.set_forkserver_preload(PRELOAD)
+
+    return context
+
+
+class JudgePool:
+    """Process pool which runs the judge off the event loop."""
+
+    executor: concurrent.futures.ProcessPoolExecutor = None
+    workers = JUDGE_WORKERS
+    # Calls in flight, so a call never waits for a worker while its timeout runs
+    slots: asyncio.Semaphore = None
+
+    @classmethod
+    def init(cls, workers: int=JUDGE_WORKERS) -> None:
+        """Start the worker processes."""
+
+        # Calls which hold a slot release it on the same semaphore after a recycle
+        if cls.slots is None or workers != cls.workers:
+            cls.slots = asyncio.Semaphore(workers)
+
+        cls.workers = workers
+        cls.executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=_context(),
+            initializer=_init_worker,
+            initargs=(Judge.corpus.path,),
+        )
+
+        log.info(f"Judge pool started with {workers} workers.")
+
+
+    @classmethod
+    def recycle(cls, executor: concurrent.futures.ProcessPoolExecutor) -> None:
+        """Kill the workers of the executor and replace it with a fresh pool."""
+
+        if executor is not cls.executor:
+            return
+
+        cls.init(cls.workers)
+
+        for process in list((executor._processes or {}).values()):
+            process.kill()
+
+        executor.shutdown(wait=False, cancel_futures=True)
+
+        log.warning("Judge pool recycled.")
+
+
+    @classmethod
+    def restart(cls) -> None:
+        """Replace the workers, submissions which are already running finish on the old ones."""
+
+        executor = cls.executor
+        cls.init(cls.workers)
+
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+
+    @classmethod
+    def shutdown(cls) -> None:
+        """Stop the worker processes."""
+
+        if cls.executor is None:
+            return
+
+        for process in list((cls.executor._processes or {}).values()):
+            process.kill()
+
+        cls.executor.shutdown(wait=False, cancel_futures=True)
+        cls.executor = None
+
+        log.info("Judge pool stopped.")
+
+
+    @classmethod
+    async def judge(cls, file: bytes, data: bytes=None, data_filename: str=None) -> JudgeResult:
+        """Judge the file in a worker process and return the result.
+
+        At most one call per worker is in flight, the others wait here before
+        JUDGE_TIMEOUT starts, so time spent queued in the executor never counts.
+
+        When the pool breaks, every submission running on it fails with it and
+        nothing tells which one crashed the worker. Each of them is judged again
+        alone in a one-off process, so the one which crashes it again cannot take
+        down the submissions of other users a second time.
+        """
+
+        # Workers link the stored data file instead of receiving and writing it again
+        data_path = await asyncio.to_thread(DataStore.put, data, data_filename) if data and data_filename else None
+
+        async with cls.slots:
+            return await cls._judge(file, data_path)
+
+
+    @classmethod
+    async def _judge(cls, file: bytes, data_path: str) -> JudgeResult:
+
+        loop = asyncio.get_running_loop()
+        executor = cls.executor
+
+        try:
+            start = time.perf_counter()
+            result = await asyncio.wait_for(
+                loop.run_in_executor(executor, _judge_worker, file, data_path),
+                timeout=JUDGE_TIMEOUT,
+            )
+            
+            Metrics.record(result.timings)
+            Metrics.observe("roundtrip", time.perf_counter() - start)
+            
+            return result
+
+        except asyncio.TimeoutError:
+            log.error(f"Judge worker did not respond within {JUDGE_TIMEOUT}s.")
+            cls.recycle(executor)
+            return JudgeResult(Status.TLE, "Time Limit Exceeded", corpus_version=Judge.corpus.version)
+
+        except BrokenProcessPool:
+            log.error("Judge worker crashed, judging the submission again in its own process.", exc_info=True)
+            cls.recycle(executor)
+
+        except asyncio.CancelledError:
+            raise
+
+        except BaseException as e:
+            log.error("Judge worker failed.", exc_info=True)
+            return JudgeResult(Status.RE, f"Runtime Error: {type(e).__name__}: {e}", corpus_version=Judge.corpus.version)
+
+        return await cls.judge_isolated(file, data_path)
+
+
+    @classmethod
+    async def judge_isolated(cls, file: bytes, data_path: str=None) -> JudgeResult:
+        """Judge the file in a single-use worker process of its own."""
+
+        loop = asyncio.get_running_loop()
+        executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=1,
+            mp_context=_context(),
+            initializer=_init_worker,
+            initargs=(Judge.corpus.path,),
+        )
+
+        try:
+            return await asyncio.wait_for(
+                loop.run_in_executor(executor, _judge_worker, file, data_path),
+                timeout=JUDGE_TIMEOUT,
+            )
+
+        except asyncio.TimeoutError:
+            log.error(f"Isolated judge worker did not respond within {JUDGE_TIMEOUT}s.")
+            return JudgeResult(Status.TLE, "Time Limit Exceeded", corpus_version=Judge.corpus.version)
+
+        except BrokenProcessPool:
+            log.error("Isolated judge worker crashed.", exc_info=True)
+            return JudgeResult(Status.RE, "Runtime Error: judge worker crashed", corpus_version=Judge.corpus.version)
+
+        except asyncio.CancelledError:
+            raise
+
+        except BaseException as e:
+            log.error("Isolated judge worker failed.", exc_info=True)
+            return JudgeResult(Status.RE, f"Runtime Error: {type(e).__name__}: {e}", corpus_version=Judge.corpus.version)
+
+        finally:
+            for process in list((executor._processes or {}).values()):
+                process.kill()
+
+            executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,155 @@
+import ast
+import inspect
+import logging
+import time
+from typing import List, Optional
+
+from bot.config import SOURCE_SIZE_LIMIT
+from bot.judge.example import Solver as ExampleSolver
+from bot.judge.metrics import Metrics
+from bot.judge.result import JudgeResult, Status
+
+
+log = logging.getLogger(__name__)
+
+# Parameter names of the methods of the example, the same ones Judge.check compares against
+METHODS = {attr: list(inspect.signature(getattr(ExampleSolver, attr)).parameters) for attr in ["solve", "setup"]}
+OPTIONAL_METHODS = {"setup"}
+
+
+def precheck(file: bytes, corpus_version: str=None) -> Optional[JudgeResult]:
+    """Check a submission without importing it, return a Compile Error result if it is certainly broken.
+
+    Only the source is parsed and compiled, so this takes milliseconds and runs
+    in the bot process before the submission is queued. Anything which cannot be
+    decided from the source alone, such as a Solver built dynamically or a
+    decorated method, is left to Judge.check in the worker.
+    """
+
+    start = time.perf_counter()
+
+    try:
+        return _precheck(file, corpus_version)
+
+    except RecursionError:
+        # The source compiles but is nested too deeply to walk, Judge.check decides
+        log.debug("Precheck skipped a deeply nested submission.")
+        return None
+
+    finally:
+        Metrics.observe("precheck", time.perf_counter() - start)
+
+
+def _precheck(file: bytes, corpus_version: str) -> Optional[JudgeResult]:
+
+    def error(message: str) -> JudgeResult:
+        log.debug(f"Precheck failed: {message}")
+        return JudgeResult(Status.CE, message, corpus_version=corpus_version)
+
+    if len(file) > SOURCE_SIZE_LIMIT * 1024:
+        return error(f"Source file is larger than {SOURCE_SIZE_LIMIT}KiB")
+
+    try:
+        tree = ast.parse(file, filename="submission.py")
+        compile(tree, "submission.py", "exec", dont_inherit=True)
+
+    except SyntaxError as e:
+        return error(f"SyntaxError: {e}")
+
+    except ValueError as e:
+        # Null bytes in the source
+        return error(f"SyntaxError: {e}")
+
+    except (RecursionError, MemoryError) as e:
+        # Nesting too deep for the parser or the compiler, the worker could not import it either
+        return error(f"SyntaxError: source is too deeply nested ({type(e).__name__})")
+
+    solver = None
+
+    for node in tree.body:
+        if _binds(node, "Solver"):
+            solver = node
+
+    if solver is None:
+        if any(isinstance(node, ast.ImportFrom) and any(alias.name == "*" for alias in node.names) for node in tree.body):
+            return None
+
+        return error("AttributeError: module has no attribute 'Solver'")
+
+    if not isinstance(solver, ast.ClassDef):
+        return None
+
+    for name, params in METHODS.items():
+        method = None
+
+        for node in solver.body:
+            if _binds(node, name):
+                method = node
+
+        if method is None:
+            # A base class may provide it
+            if name in OPTIONAL_METHODS or solver.bases or solver.keywords:
+                continue
+
+            return error(f"Solver does not have {name} method")
+
+        if not isinstance(method, (ast.FunctionDef, ast.AsyncFunctionDef)) or any(not _is_name(decorator, "staticmethod") for decorator in method.decorator_list):
+            continue
+
+        result = _check_signature(name, method, params)
+
+        if result is not None:
+            return error(result)
+
+    return None
+
+
+def _check_signature(name: str, method: ast.FunctionDef, params: List[str]) -> Optional[str]:
+    """Mirror the signature checks of Judge.check on the source."""
+
+    args = method.args
+    positional = args.posonlyargs + args.args
+    count = len(positional) + len(args.kwonlyargs) + (args.vararg is not None) + (args.kwarg is not None)
+
+    if count != len(params):
+        return f"{name} takes {count} parameters, but it should take {len(params)}"
+
+    for arg, param in zip(positional + args.kwonlyargs, params):
+        if arg.arg != param:
+            return f"{arg.arg} does not match {param}"
+
+        if arg.annotation is None:
+            return f"{arg.arg} has no type hint"
+
+    if len([default for default in args.defaults + args.kw_defaults if default is not None]):
+        return f"{positional[-1].arg if args.defaults else args.kwonlyargs[0].arg} has a default value"
+
+    if name == "solve" and method.returns is not None and not _is_name(method.returns, "str"):
+        return f"solve should return str, but it is annotated with {ast.unparse(method.returns)}"
+
+    return None
+
+
+def _is_name(node: ast.expr, name: str) -> bool:
+
+    return (isinstance(node, ast.Name) and node.id == name) or (isinstance(node, ast.Constant) and node.value == name)
+
+
+def _binds(node: ast.stmt, name: str) -> bool:
+    """Return True if a statement of a module or class body binds name."""
+
+    if isinstance(node, (ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)):
+        return node.name == name
+
+    if isinstance(node, (ast.Import, ast.ImportFrom)):
+        return any((alias.asname or alias.name.split(".")[0]) == name for alias in node.names)
+
+    # Assignments, and definitions nested in if/try/with/for blocks
+    for child in ast.walk(node):
+        if isinstance(child, ast.Name) and isinstance(child.ctx, ast.Store) and child.id == name:
+            return True
+
+        if child is not node and isinstance(child, (ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef, ast.Import, ast.ImportFrom)) and _binds(child, name):
+            return True
+
+    return False
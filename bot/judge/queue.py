@@ -0,0 +1,226 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional
+
+from bot.config import QUEUE_MAX_DEPTH
+from bot.judge import Judge
+from bot.judge.metrics import Metrics
+from bot.judge.pool import JudgePool
+from bot.judge.result import JudgeResult, Status
+
+
+log = logging.getLogger(__name__)
+
+
+class QueueFull(Exception):
+    pass
+
+
+class Submission:
+    """A submission waiting in the queue."""
+
+    def __init__(self, user_id: int, file: bytes, data: bytes=None, data_filename: str=None) -> None:
+        self.user_id = user_id
+        self.file = file
+        self.data = data
+        self.data_filename = data_filename
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.enqueued_at = time.monotonic()
+        self.started_at: Optional[float] = None
+
+
+    @property
+    def running(self) -> bool:
+        return self.started_at is not None
+
+
+class SubmissionQueue:
+    """Bounded submission queue which serves users in round-robin order."""
+
+    max_depth = QUEUE_MAX_DEPTH
+    queues: Dict[int, Deque[Submission]] = {}
+    order: Deque[int] = deque()
+    tasks: List[asyncio.Task] = []
+    pending: asyncio.Semaphore = None
+
+    # Metrics
+    running = 0
+    enqueued = 0
+    rejected = 0
+    completed = 0
+    peak_depth = 0
+    avg_wait_time: Optional[float] = None
+    avg_judge_time: Optional[float] = None
+
+    @classmethod
+    def start(cls) -> None:
+        """Start one consumer per judge worker on the running event loop."""
+
+        cls.pending = asyncio.Semaphore(cls.depth())
+        cls.tasks = [asyncio.create_task(cls._consume()) for _ in range(JudgePool.workers)]
+
+        log.info(f"Submission queue started with {len(cls.tasks)} consumers.")
+
+
+    @classmethod
+    def depth(cls) -> int:
+        """Number of submissions waiting to be judged."""
+
+        return sum(len(q) for q in cls.queues.values())
+
+
+    @classmethod
+    def full(cls) -> bool:
+
+        return cls.depth() >= cls.max_depth
+
+
+    @classmethod
+    def put(cls, user_id: int, file: bytes, data: bytes=None, data_filename: str=None) -> Submission:
+        """Enqueue a submission, raise QueueFull when the queue is at max depth."""
+
+        if cls.full():
+            cls.rejected += 1
+            log.warning(f"Submission queue is full ({cls.max_depth}), rejected submission of {user_id}.")
+            raise QueueFull(f"Submission queue is full ({cls.max_depth})")
+
+        if not cls.tasks:
+            cls.start()
+
+        submission = Submission(user_id, file, data, data_filename)
+
+        if user_id not in cls.queues:
+            cls.queues[user_id] = deque()
+            cls.order.append(user_id)
+
+        cls.queues[user_id].append(submission)
+        cls.enqueued += 1
+        cls.peak_depth = max(cls.peak_depth, cls.depth())
+        cls.pending.release()
+
+        return submission
+
+
+    @classmethod
+    def position(cls, submission: Submission) -> int:
+        """Number of submissions which will be judged before this one."""
+
+        if submission.running or submission.user_id not in cls.queues:
+            return 0
+
+        own_queue = cls.queues[submission.user_id]
+
+        try:
+            index = own_queue.index(submission)
+        except ValueError:
+            return 0
+
+        ahead = index
+        before = True
+
+        for user_id in cls.order:
+            if user_id == submission.user_id:
+                before = False
+                continue
+
+            ahead += min(len(cls.queues[user_id]), index + before)
+
+        return ahead
+
+
+    @classmethod
+    def eta(cls, submission: Submission) -> Optional[float]:
+        """Estimated seconds until the submission is judged."""
+
+        if cls.avg_judge_time is None:
+            return None
+
+        rounds = cls.position(submission) // max(JudgePool.workers, 1) + 1
+
+        return rounds * cls.avg_judge_time
+
+
+    @classmethod
+    def metrics(cls) -> dict:
+        """Back-pressure metrics of the queue."""
+
+        return {
+            "depth": cls.depth(),
+            "max_depth": cls.max_depth,
+            "peak_depth": cls.peak_depth,
+            "running": cls.running,
+            "users": len(cls.order),
+            "enqueued": cls.enqueued,
+            "rejected": cls.rejected,
+            "completed": cls.completed,
+            "avg_wait_time": cls.avg_wait_time,
+            "avg_judge_time": cls.avg_judge_time,
+        }
+
+
+    @classmethod
+    def _pop(cls) -> Submission:
+        """Take the next submission in round-robin order."""
+
+        user_id = cls.order.popleft()
+        submission = cls.queues[user_id].popleft()
+
+        if cls.queues[user_id]:
+            cls.order.append(user_id)
+        else:
+            del cls.queues[user_id]
+
+        return submission
+
+
+    @staticmethod
+    def _average(average: Optional[float], value: float, alpha: float=0.2) -> float:
+
+        return value if average is None else average * (1 - alpha) + value * alpha
+
+
+    @classmethod
+    async def _consume(cls) -> None:
+
+        while True:
+            await cls.pending.acquire()
+            submission = cls._pop()
+
+            if submission.future.done():
+                continue
+
+            submission.started_at = time.monotonic()
+            cls.running += 1
+            cls.avg_wait_time = cls._average(cls.avg_wait_time, submission.started_at - submission.enqueued_at)
+            Metrics.observe("queue_wait", submission.started_at - submission.enqueued_at)
+
+            try:
+                result: JudgeResult = await JudgePool.judge(
+                    file=submission.file,
+                    data=submission.data,
+                    data_filename=submission.data_filename,
+                )
+
+                if not submission.future.done():
+                    submission.future.set_result(result)
+
+            except Exception as e:
+                log.error(f"Failed to judge submission of {submission.user_id}", exc_info=True)
+
+                # The waiting submitter still gets a verdict to show and store
+                if not submission.future.done():
+                    submission.future.set_result(JudgeResult(Status.RE, f"Runtime Error: {type(e).__name__}: {e}", corpus_version=Judge.corpus.version))
+
+            finally:
+                cls.running -= 1
+                cls.completed += 1
+                cls.avg_judge_time = cls._average(cls.avg_judge_time, time.monotonic() - submission.started_at)
+
+
+Metrics.gauge("queue_depth", SubmissionQueue.depth)
+Metrics.gauge("queue_running", lambda: SubmissionQueue.running)
+Metrics.gauge("queue_rejected_total", lambda: SubmissionQueue.rejected)
+Metrics.gauge("workers", lambda: JudgePool.workers)
+Metrics.gauge("worker_utilisation", lambda: SubmissionQueue.running / max(JudgePool.workers, 1))
@@ -0,0 +1,69 @@
+from typing import Dict, List, Optional, Tuple
+
+from sortedcontainers import SortedKeyList
+
+
+class Ranklist:
+    """Best score of every user, ordered by score with O(log n) updates and rank lookups."""
+
+    def __init__(self, scores: Dict[str, float]=None) -> None:
+        self.scores: Dict[str, float] = {}
+        # Highest score first, ties broken by name so that the order is stable
+        self.index = SortedKeyList(key=lambda item: (-item[1], item[0]))
+
+        for username, score in (scores or {}).items():
+            self.update(username, score)
+
+
+    def __len__(self) -> int:
+
+        return len(self.index)
+
+
+    def __contains__(self, username: str) -> bool:
+
+        return username in self.scores
+
+
+    def update(self, username: str, score: float) -> bool:
+        """Keep the score if it is the user's best, return True if it was kept."""
+
+        old_score = self.scores.get(username)
+
+        if old_score is not None:
+            if old_score >= score:
+                return False
+
+            self.index.remove((username, old_score))
+
+        self.scores[username] = score
+        self.index.add((username, score))
+
+        return True
+
+
+    def get(self, username: str) -> Optional[float]:
+
+        return self.scores.get(username)
+
+
+    def rank(self, username: str) -> Optional[int]:
+        """1-based rank of the user, None if the user has no score."""
+
+        score = self.scores.get(username)
+
+        if score is None:
+            return None
+
+        return self.index.index((username, score)) + 1
+
+
+    def page(self, offset: int, limit: int) -> List[Tuple[str, float]]:
+        """Return (username, score) pairs from offset, in rank order."""
+
+        return list(self.index.islice(offset, offset + limit))
+
+
+    def items(self) -> List[Tuple[str, float]]:
+
+        return list(self.index)
@@ -0,0 +1,143 @@
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+
+from bot.database.store import SubmissionStore
+from bot.judge import Judge
+from bot.judge.cache import VerdictCache
+from bot.judge.pool import JudgePool
+from bot.judge.precheck import precheck
+from bot.judge.ranklist import Ranklist
+from bot.judge.result import JudgeResult, Status
+
+
+log = logging.getLogger(__name__)
+
+# Submissions read from the database at a time
+PAGE_SIZE = 200
+# Verdicts written to the database in one transaction
+BATCH_SIZE = 100
+
+
+class Rejudge:
+    """Replay every stored submission through the judge pool and overwrite its verdict.
+
+    Submissions are streamed page by page and at most `concurrency` of them are
+    in the pool at once, never more than it has workers, so uploads of users
+    still get their turn. Identical
+    uploads are judged once per run.
+    """
+
+    running = False
+    total = 0
+    done = 0
+    judged = 0
+    started_at: Optional[float] = None
+
+    @classmethod
+    def eta(cls) -> Optional[float]:
+        """Estimated seconds until the rejudge finishes."""
+
+        if not cls.done or cls.started_at is None:
+            return None
+
+        return (time.monotonic() - cls.started_at) / cls.done * (cls.total - cls.done)
+
+
+    @classmethod
+    async def run(cls, concurrency: int=None) -> int:
+        """Rejudge all submissions and return how many were updated."""
+
+        if cls.running:
+            raise RuntimeError("A rejudge is already running")
+
+        cls.running = True
+        cls.done = 0
+        cls.judged = 0
+        cls.started_at = time.monotonic()
+
+        slots = asyncio.Semaphore(max(min(concurrency or JudgePool.workers, JudgePool.workers), 1))
+        verdicts: Dict[str, asyncio.Task] = {}
+        pending: List[Tuple[int, JudgeResult, str]] = []
+        tasks: List[asyncio.Task] = []
+
+        async def judge(file: bytes, data: bytes, data_filename: str) -> JudgeResult:
+            result = precheck(file, Judge.corpus.version)
+
+            if result is not None:
+                return result
+
+            async with slots:
+                cls.judged += 1
+
+                # One failing submission must not abort the run and lose the verdicts not written yet
+                try:
+                    return await JudgePool.judge(file=file, data=data, data_filename=data_filename)
+
+                except Exception as e:
+                    log.error("Failed to rejudge a submission.", exc_info=True)
+                    return JudgeResult(Status.RE, f"Runtime Error: {type(e).__name__}: {e}", corpus_version=Judge.corpus.version)
+
+        async def finish(submission_id: int, key: str) -> None:
+            result = await verdicts[key]
+            pending.append((submission_id, result, key))
+            cls.done += 1
+
+            if len(pending) >= BATCH_SIZE:
+                batch = pending[:]
+                pending.clear()
+                await asyncio.to_thread(SubmissionStore.update_verdicts, batch)
+
+        try:
+            # Verdicts which are still queued for writing would be missed
+            await SubmissionStore.flush()
+            VerdictCache.clear()
+
+            cls.total = await asyncio.to_thread(SubmissionStore.count)
+            after_id = 0
+
+            while True:
+                rows = await asyncio.to_thread(SubmissionStore.sources, after_id, PAGE_SIZE)
+
+                if not rows:
+                    break
+
+                for submission_id, file, data, data_filename in rows:
+                    key = VerdictCache.key(file, data, data_filename, Judge.corpus.version)
+
+                    if key not in verdicts:
+                        verdicts[key] = asyncio.create_task(judge(file, data, data_filename))
+
+                    tasks.append(asyncio.create_task(finish(submission_id, key)))
+
+                after_id = rows[-1][0]
+
+                # Read the next page only when the pool is about to run dry
+                while True:
+                    tasks = [task for task in tasks if not task.done() or task.exception() is not None]
+                    running = [task for task in tasks if not task.done()]
+
+                    if len(running) <= PAGE_SIZE:
+                        break
+
+                    await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+
+            await asyncio.gather(*tasks)
+            await asyncio.to_thread(SubmissionStore.update_verdicts, pending)
+
+            await asyncio.to_thread(SubmissionStore.refresh_best_scores)
+            Judge.ranklist = Ranklist(await asyncio.to_thread(SubmissionStore.best_scores))
+
+            for key, task in verdicts.items():
+                VerdictCache.put(key, task.result())
+
+            log.info(f"Rejudged {cls.done} submissions ({cls.judged} distinct) in {time.monotonic() - cls.started_at:.1f}s.")
+
+            return cls.done
+
+        finally:
+            for task in tasks + list(verdicts.values()):
+                task.cancel()
+
+            cls.running = False
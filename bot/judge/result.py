@@ -0,0 +1,42 @@
+from typing import Dict, List, NamedTuple, Optional
+
+from bot.judge import scoring
+
+
+class Status:
+    AC = 0
+    WA = 1
+    TLE = 2
+    RE = 3
+    CE = 4
+
+
+class CaseResult(NamedTuple):
+    time: float
+    cpu_time: float
+    steps: int
+    max_steps: int
+    rss: int # KiB
+
+
+class JudgeResult:
+    """Verdict of one submission together with the results of the cases it passed."""
+
+    def __init__(self, status: int, message: str, cases: List[CaseResult]=None, corpus_version: str=None, timings: Optional[Dict[str, float]]=None) -> None:
+        self.status = status
+        self.message = message
+        self.cases = cases or []
+        self.corpus_version = corpus_version
+        # Seconds spent in each phase of judging, None when metrics are disabled
+        self.timings = timings
+
+
+    @property
+    def score(self) -> float:
+
+        return scoring.score(self.cases) if self.status == Status.AC else 0.0
+
+
+    def __repr__(self) -> str:
+
+        return f"JudgeResult(status={self.status}, message={self.message!r}, cases={len(self.cases)})"
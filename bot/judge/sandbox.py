@@ -0,0 +1,457 @@
+import concurrent.futures
+import itertools
+import logging
+import math
+import os
+import pickle
+import select
+import signal
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Iterable, Iterator, NamedTuple, Union
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from bot.config import TIME_LIMIT, MEMORY_LIMIT
+
+
+log = logging.getLogger(__name__)
+
+# Extra wall time given to the child for fork and pickling before it is killed.
+GRACE_TIME = 0.5
+
+# Wall-clock allowance, as a multiple of the time limit, for children timed on CPU time.
+WALL_FACTOR = 3
+
+
+class RunResult(NamedTuple):
+    result: Any
+    elapsed_time: float
+    cpu_time: float
+    max_rss: int # KiB
+
+
+def _address_space() -> int:
+    """Return the virtual memory size of the current process in bytes."""
+
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+
+    except (OSError, ValueError):
+        return 0
+
+
+def _set_limits(time_limit: float, memory_limit: int) -> None:
+    """Apply the CPU time and address space limits to the current process."""
+
+    if resource is None:
+        return
+
+    cpu_limit = math.ceil(time_limit) + 1
+    resource.setrlimit(resource.RLIMIT_CPU, (cpu_limit, cpu_limit + 1))
+
+    if memory_limit:
+        # The child inherits the address space of the judge, so the limit is on top of it.
+        memory = _address_space() + memory_limit * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (memory, memory))
+
+
+def _lower_limits(time_limit: float, memory_limit: int) -> list:
+    """Lower the soft CPU time and address space limits of the current process, return the previous ones.
+
+    The hard limits are kept, so the previous limits can be restored afterwards.
+    """
+
+    if resource is None:
+        return []
+
+    limits = [(resource.RLIMIT_CPU, math.ceil(time_limit) + 1)]
+
+    if memory_limit:
+        limits.append((resource.RLIMIT_AS, _address_space() + memory_limit * 1024 * 1024))
+
+    previous = []
+
+    for limit, value in limits:
+        soft, hard = resource.getrlimit(limit)
+        previous.append((limit, (soft, hard)))
+
+        if hard != resource.RLIM_INFINITY:
+            value = min(value, hard)
+
+        resource.setrlimit(limit, (value, hard))
+
+    return previous
+
+
+def _restore_limits(previous: list) -> None:
+
+    for limit, values in previous:
+        resource.setrlimit(limit, values)
+
+
+def _send(write_fd: int, payload: tuple) -> None:
+    """Pickle the payload and write it to the pipe, a result which cannot be pickled is replaced by an error."""
+
+    try:
+        data = pickle.dumps(payload)
+
+    except Exception as e:
+        data = pickle.dumps((False, RuntimeError(f"Unable to send the result: {e}")) + payload[2:])
+
+    view = memoryview(data)
+
+    while view:
+        view = view[os.write(write_fd, view):]
+
+
+def _error(e: BaseException) -> Exception:
+    """Return the exception to send to the parent, SystemExit and friends must not propagate into the judge."""
+
+    return e if isinstance(e, Exception) else RuntimeError(f"{type(e).__name__}: {e}")
+
+
+def _child(write_fd: int, func: Callable, args: tuple, kwargs: dict, time_limit: float, memory_limit: int) -> None:
+    """Run the function in the forked child and send the outcome through the pipe."""
+
+    try:
+        _set_limits(time_limit, memory_limit)
+
+        start_cpu = time.process_time()
+        start_time = time.perf_counter()
+        result = func(*args, **kwargs)
+        elapsed_time = time.perf_counter() - start_time
+        cpu_time = time.process_time() - start_cpu
+
+        payload = (True, result, elapsed_time, cpu_time)
+
+    except BaseException as e:
+        payload = (False, _error(e), 0, 0)
+
+    _send(write_fd, payload)
+
+
+def _setup_child(write_fd: int, setup: Callable, func: Callable, args: tuple, kwargs: dict, time_limit: float, memory_limit: int) -> None:
+    """Run setup under the limits and then the function in the forked child.
+
+    A marker byte tells the parent whether setup succeeded, b"S", or failed, b"E".
+    It is followed by the outcome of the function or by the error of setup.
+    """
+
+    error = None
+    previous = _lower_limits(time_limit, memory_limit)
+
+    try:
+        setup()
+
+    except BaseException as e:
+        error = _error(e)
+
+    finally:
+        _restore_limits(previous)
+
+    if error is not None:
+        os.write(write_fd, b"E")
+        _send(write_fd, (False, error))
+        return
+
+    os.write(write_fd, b"S")
+
+    try:
+        payload = (True, func(*args, **kwargs))
+
+    except BaseException as e:
+        payload = (False, _error(e))
+
+    _send(write_fd, payload)
+
+
+def _run_thread(func: Callable, *args, time_limit: float, **kwargs) -> RunResult:
+    """Fallback for platforms without fork, the thread cannot be killed on timeout."""
+
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+    future = executor.submit(func, *args, **kwargs)
+
+    try:
+        start_time = time.perf_counter()
+        result = future.result(timeout=time_limit)
+        elapsed_time = time.perf_counter() - start_time
+        return RunResult(result, elapsed_time, elapsed_time, 0)
+
+    except concurrent.futures.TimeoutError:
+        raise TimeoutError("Time Limit Exceeded")
+
+    finally:
+        executor.shutdown(wait=False)
+
+
+class Child:
+    """A forked child process running one call, killed when it exceeds the time limit.
+
+    With cpu_timing the time limit applies to the CPU time of the call, so that
+    children running side by side are not penalised for sharing the cores. The
+    wall-clock deadline is then only a backstop against sleeping or blocked children.
+    """
+
+    def __init__(self, func: Callable, *args, time_limit: float=TIME_LIMIT, memory_limit: int=MEMORY_LIMIT, cpu_timing: bool=False, **kwargs) -> None:
+        self.time_limit = time_limit
+        self.cpu_timing = cpu_timing
+        self.read_fd, write_fd = os.pipe()
+        self.pid = os.fork()
+
+        if self.pid == 0:
+            try:
+                os.close(self.read_fd)
+                _child(write_fd, func, args, kwargs, time_limit, memory_limit)
+            finally:
+                os._exit(0)
+
+        os.close(write_fd)
+
+        wall_limit = time_limit * WALL_FACTOR if cpu_timing else time_limit
+        self.deadline = time.perf_counter() + wall_limit + GRACE_TIME
+
+
+    def kill(self) -> None:
+        """Kill the child and reap it."""
+
+        if self.pid is None:
+            return
+
+        try:
+            os.kill(self.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+        os.close(self.read_fd)
+        os.wait4(self.pid, 0)
+        self.pid = None
+
+
+    def wait(self) -> RunResult:
+        """Wait for the child and return its result, raise TimeoutError when it is too slow."""
+
+        chunks = []
+        timeout = False
+
+        try:
+            while True:
+                remaining = self.deadline - time.perf_counter()
+
+                if remaining <= 0 or not select.select([self.read_fd], [], [], remaining)[0]:
+                    timeout = True
+                    os.kill(self.pid, signal.SIGKILL)
+                    break
+
+                chunk = os.read(self.read_fd, 1 << 16)
+
+                if not chunk:
+                    break
+
+                chunks.append(chunk)
+
+        finally:
+            os.close(self.read_fd)
+            _, status, usage = os.wait4(self.pid, 0)
+            self.pid = None
+
+        if timeout:
+            raise TimeoutError("Time Limit Exceeded")
+
+        if os.WIFSIGNALED(status):
+            if os.WTERMSIG(status) in (signal.SIGXCPU, signal.SIGKILL):
+                raise TimeoutError("Time Limit Exceeded")
+
+            raise RuntimeError(f"Solver was killed by signal {signal.Signals(os.WTERMSIG(status)).name}")
+
+        if not chunks:
+            raise RuntimeError("Solver exited without a result")
+
+        try:
+            ok, result, elapsed_time, cpu_time = pickle.loads(b"".join(chunks))
+
+        except Exception as e:
+            raise RuntimeError(f"Unable to receive the result: {e}")
+
+        if not ok and isinstance(result, MemoryError):
+            raise MemoryError("Memory Limit Exceeded")
+
+        if not ok:
+            raise result
+
+        if (cpu_time if self.cpu_timing else elapsed_time) > self.time_limit:
+            raise TimeoutError("Time Limit Exceeded")
+
+        return RunResult(result, elapsed_time, cpu_time, usage.ru_maxrss)
+
+
+class SetupChild:
+    """A forked child process running setup under the limits, then one call in the state it built.
+
+    Setup is killed with SIGKILL once it exceeds the time limit, which it can
+    neither catch nor delay. The lowered CPU time and address space limits are
+    only a backstop and are lifted again before the call, which sets its own.
+    """
+
+    def __init__(self, setup: Callable, func: Callable, *args, time_limit: float, memory_limit: int=MEMORY_LIMIT, **kwargs) -> None:
+        self.read_fd, write_fd = os.pipe()
+        self.pid = os.fork()
+
+        if self.pid == 0:
+            try:
+                os.close(self.read_fd)
+                _setup_child(write_fd, setup, func, args, kwargs, time_limit, memory_limit)
+            finally:
+                os._exit(0)
+
+        os.close(write_fd)
+
+        self.deadline = time.perf_counter() + time_limit + GRACE_TIME
+
+
+    def wait_setup(self) -> None:
+        """Wait until setup has finished, raise TimeoutError when it is too slow and its error when it fails."""
+
+        remaining = self.deadline - time.perf_counter()
+
+        if remaining <= 0 or not select.select([self.read_fd], [], [], remaining)[0]:
+            self.kill()
+            raise TimeoutError("Time Limit Exceeded")
+
+        if os.read(self.read_fd, 1) == b"S":
+            return
+
+        # Raises the error of setup, or how the child died
+        self.finish(self.deadline)
+        raise RuntimeError("Setup exited without a result")
+
+
+    def kill(self) -> None:
+        """Kill the child and reap it."""
+
+        if self.pid is None:
+            return
+
+        try:
+            os.kill(self.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+        os.close(self.read_fd)
+        os.wait4(self.pid, 0)
+        self.pid = None
+
+
+    def wait(self) -> Any:
+        """Wait for the call after setup and return its result.
+
+        There is no deadline, the call is expected to limit the work it starts.
+        """
+
+        return self.finish(None)
+
+
+    def finish(self, deadline: float=None) -> Any:
+        """Read the outcome until the child exits, it is killed when the deadline passes."""
+
+        chunks = []
+        timeout = False
+
+        try:
+            while True:
+                if deadline is not None:
+                    remaining = deadline - time.perf_counter()
+
+                    if remaining <= 0 or not select.select([self.read_fd], [], [], remaining)[0]:
+                        timeout = True
+                        os.kill(self.pid, signal.SIGKILL)
+                        break
+
+                chunk = os.read(self.read_fd, 1 << 16)
+
+                if not chunk:
+                    break
+
+                chunks.append(chunk)
+
+        finally:
+            os.close(self.read_fd)
+            _, status, _ = os.wait4(self.pid, 0)
+            self.pid = None
+
+        if timeout:
+            raise TimeoutError("Time Limit Exceeded")
+
+        if os.WIFSIGNALED(status):
+            if os.WTERMSIG(status) in (signal.SIGXCPU, signal.SIGKILL):
+                raise TimeoutError("Time Limit Exceeded")
+
+            raise RuntimeError(f"Solver was killed by signal {signal.Signals(os.WTERMSIG(status)).name}")
+
+        if not chunks:
+            raise RuntimeError("Solver exited without a result")
+
+        try:
+            ok, result = pickle.loads(b"".join(chunks))
+
+        except Exception as e:
+            raise RuntimeError(f"Unable to receive the result: {e}")
+
+        if not ok and isinstance(result, MemoryError):
+            raise MemoryError("Memory Limit Exceeded")
+
+        if not ok:
+            raise result
+
+        return result
+
+
+def run(func: Callable, *args, time_limit: float=TIME_LIMIT, memory_limit: int=MEMORY_LIMIT, **kwargs) -> RunResult:
+    """Run the function in a child process which is killed when it exceeds the time limit."""
+
+    if not hasattr(os, "fork"):
+        log.warning("fork is not supported on this platform, falling back to threads.")
+        return _run_thread(func, *args, time_limit=time_limit, **kwargs)
+
+    return Child(func, *args, time_limit=time_limit, memory_limit=memory_limit, **kwargs).wait()
+
+
+def run_many(func: Callable, calls: Iterable[tuple], workers: int, time_limit: float=TIME_LIMIT, memory_limit: int=MEMORY_LIMIT) -> Iterator[Union[RunResult, Exception]]:
+    """Run the function once per argument tuple with up to workers children at a time.
+
+    Outcomes are yielded in order, an exception is yielded instead of raised. Children
+    still running are killed when the generator is closed, so a caller may stop early.
+    The time limit is applied to CPU time.
+    """
+
+    if not hasattr(os, "fork"):
+        for args in calls:
+            try:
+                yield run(func, *args, time_limit=time_limit, memory_limit=memory_limit)
+            except Exception as e:
+                yield e
+        return
+
+    calls = iter(calls)
+    running: Deque[Child] = deque()
+
+    try:
+        while True:
+            for args in itertools.islice(calls, max(workers - len(running), 0)):
+                running.append(Child(func, *args, time_limit=time_limit, memory_limit=memory_limit, cpu_timing=True))
+
+            if not running:
+                break
+
+            try:
+                yield running.popleft().wait()
+            except Exception as e:
+                yield e
+
+    finally:
+        for child in running:
+            child.kill()
@@ -0,0 +1,61 @@
+import json
+import logging
+from typing import Iterable, Sequence, Tuple
+
+import numpy as np
+
+from bot.config import TIME_LIMIT
+
+
+log = logging.getLogger(__name__)
+
+
+def score_arrays(time: np.ndarray, steps: np.ndarray, max_steps: np.ndarray, time_limit: float=TIME_LIMIT) -> np.ndarray:
+    """Score many submissions at once from their total time, steps and reference steps."""
+
+    time = np.asarray(time, dtype=np.float64)
+    steps = np.asarray(steps, dtype=np.float64)
+    max_steps = np.asarray(max_steps, dtype=np.float64)
+
+    return np.exp(-time / time_limit) * 50 + np.exp(-steps / np.maximum(max_steps, 1)) * 50
+
+
+def score(cases: Iterable, time_limit: float=TIME_LIMIT) -> float:
+    """Score one submission from the results of its cases."""
+
+    cases = list(cases)
+
+    if not cases:
+        return 0.0
+
+    time, steps, max_steps = np.array([(case.time, case.steps, case.max_steps) for case in cases], dtype=np.float64).sum(axis=0)
+
+    return float(score_arrays(time, steps, max_steps, time_limit))
+
+
+def totals(cases_column: Sequence) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Sum time, steps and reference steps per submission from stored per-case results.
+
+    cases_column holds one list of case dicts (or its JSON text) per submission. The
+    cases are flattened into arrays and summed per submission with np.add.reduceat.
+    """
+
+    counts = np.zeros(len(cases_column), dtype=np.int64)
+    flat = []
+
+    for idx, cases in enumerate(cases_column):
+        if isinstance(cases, str):
+            cases = json.loads(cases)
+
+        counts[idx] = len(cases)
+        flat.extend((case["time"], case["steps"], case["max_steps"]) for case in cases)
+
+    result = np.zeros((len(cases_column), 3), dtype=np.float64)
+
+    if flat:
+        flat = np.array(flat, dtype=np.float64)
+        offsets = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        has_cases = counts > 0
+        result[has_cases] = np.add.reduceat(flat, offsets[has_cases], axis=0)
+
+    return result[:, 0], result[:, 1], result[:, 2]
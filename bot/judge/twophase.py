@@ -0,0 +1,490 @@
+import itertools
+import logging
+import math
+import os
+import shutil
+import tempfile
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from bot.config import TABLES_DIR, REFERENCE_SEARCH_NODES
+from bot.judge.verifier import Verifier
+
+
+log = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+
+# Faces in Kociemba order, move m turns face m // 3 by m % 3 + 1 clockwise quarter turns
+FACES = "URFDLB"
+MOVES = [f"{face}{suffix}" for face in FACES for suffix in ("", "2", "'")]
+
+# Moves which keep a cube in the phase 2 subgroup <U, D, R2, F2, L2, B2>
+PHASE2_MOVES = [0, 1, 2, 4, 7, 9, 10, 11, 13, 16]
+
+# Deeper phase 2 searches cost more than trying the next phase 1 solution
+PHASE2_MAX_LENGTH = 12
+
+# (move, face) pairs which may follow a turn of a face, the same face twice or opposite
+# faces in both orders only repeat shorter sequences, -1 is no previous turn
+FOLLOWING = {
+    last: [(move, move // 3) for move in range(18) if move // 3 != last and move // 3 != last - 3]
+    for last in range(-1, 6)
+}
+PHASE2_FOLLOWING = {
+    last: [(idx, move, move // 3) for idx, move in enumerate(PHASE2_MOVES) if move // 3 != last and move // 3 != last - 3]
+    for last in range(-1, 6)
+}
+
+# Blocks of magiccube's get() order (U, L, F, R, B, D) in Kociemba order
+KOCIEMBA_ORDER = np.concatenate([np.arange(block * 9, block * 9 + 9) for block in (0, 3, 2, 5, 1, 4)])
+
+U, R, F, D, L, B = range(6)
+
+# Facelets of every corner (URF, UFL, ULB, UBR, DFR, DLF, DBL, DRB) and edge
+# (UR, UF, UL, UB, DR, DF, DL, DB, FR, FL, BL, BR) in Kociemba facelet indexes
+CORNER_FACELETS = [[8, 9, 20], [6, 18, 38], [0, 36, 47], [2, 45, 11], [29, 26, 15], [27, 44, 24], [33, 53, 42], [35, 17, 51]]
+CORNER_COLORS = [[U, R, F], [U, F, L], [U, L, B], [U, B, R], [D, F, R], [D, L, F], [D, B, L], [D, R, B]]
+EDGE_FACELETS = [[5, 10], [7, 19], [3, 37], [1, 46], [32, 16], [28, 25], [30, 43], [34, 52], [23, 12], [21, 41], [50, 39], [48, 14]]
+EDGE_COLORS = [[U, R], [U, F], [U, L], [U, B], [D, R], [D, F], [D, L], [D, B], [F, R], [F, L], [B, L], [B, R]]
+
+TWISTS = 3 ** 7
+FLIPS = 2 ** 11
+SLICE_POSITIONS = math.comb(12, 4)
+SLICE_PERMUTATIONS = 24
+
+# Slice position coordinate of the FR, FL, BL, BR edges in their own positions
+SOLVED_SLICE = SLICE_POSITIONS - 1
+
+Cubies = Tuple[List[int], List[int], List[int], List[int]]
+
+
+class TwoPhaseSolver:
+    """Kociemba's two-phase algorithm for the 3x3 cube, used for the reference step counts.
+
+    Phase 1 brings a cube into the subgroup <U, D, R2, F2, L2, B2>, where every
+    corner and edge is oriented and the slice edges are in the middle layer, and
+    phase 2 solves it with the moves of that subgroup. Both phases are IDA*
+    searches over coordinates, guided by pruning tables of the exact distances
+    of two coordinate pairs each.
+
+    The move and pruning tables are generated once with numpy, saved as .npy
+    files under TABLES_DIR and memory-mapped afterwards. The first solution is
+    improved until REFERENCE_SEARCH_NODES nodes are searched, a node budget
+    rather than a time limit keeps the reference lengths reproducible.
+
+    The solver only holds the read-only tables, the state of a search lives in
+    a _Search of its own, so threads may share the solver returned by get.
+    """
+
+    instance: Optional["TwoPhaseSolver"] = None
+
+    def __init__(self, tables: Dict[str, np.ndarray], path: str=None) -> None:
+        self.tables = tables
+        self.path = path
+
+        # Flat memoryviews index much faster than numpy scalars in the search
+        self.twist_move = memoryview(tables["twist_move"]).cast("B").cast("H")
+        self.flip_move = memoryview(tables["flip_move"]).cast("B").cast("H")
+        self.position_move = memoryview(tables["position_move"]).cast("B").cast("H")
+        self.corners_move = memoryview(tables["corners_move"]).cast("B").cast("H")
+        self.edges_move = memoryview(tables["edges_move"]).cast("B").cast("H")
+        self.slice_perm_move = memoryview(tables["slice_perm_move"]).cast("B")
+
+        self.twist_prune = memoryview(tables["twist_prune"]).cast("B")
+        self.flip_prune = memoryview(tables["flip_prune"]).cast("B")
+        self.corners_prune = memoryview(tables["corners_prune"]).cast("B")
+        self.edges_prune = memoryview(tables["edges_prune"]).cast("B")
+
+        self.move_cubies = build_move_cubies()
+
+
+    @classmethod
+    def get(cls, directory: str=TABLES_DIR) -> "TwoPhaseSolver":
+        """Return the shared solver, loading or generating its tables on the first call."""
+
+        if cls.instance is None:
+            cls.instance = cls.load(directory)
+
+        return cls.instance
+
+
+    @classmethod
+    def load(cls, directory: str=TABLES_DIR) -> "TwoPhaseSolver":
+        """Memory-map the tables under directory, generate and save them first if they are missing."""
+
+        path = os.path.join(directory, f"twophase-{FORMAT_VERSION}")
+
+        if not os.path.isdir(path):
+            start = time.perf_counter()
+            tables = generate_tables()
+            log.info(f"Generated two-phase tables in {time.perf_counter() - start:.1f}s.")
+            save_tables(tables, directory, path)
+
+        tables = {
+            filename[:-len(".npy")]: np.load(os.path.join(path, filename), mmap_mode="r")
+            for filename in os.listdir(path)
+            if filename.endswith(".npy")
+        }
+
+        return cls(tables, path)
+
+
+    def solve(self, state: np.ndarray, max_length: int=24, max_nodes: int=REFERENCE_SEARCH_NODES) -> str:
+        """Return a solution of a 3x3 state, an array of color codes in magiccube get() order.
+
+        The shortest solution found within max_nodes search nodes is returned,
+        the search goes on past the budget until one of at most max_length moves
+        is found. Raises ValueError if the state is not a solvable cube.
+        """
+
+        cubies = to_cubies(np.asarray(state)[KOCIEMBA_ORDER])
+        cp, co, ep, eo = cubies
+
+        twist = sum(co[idx] * 3 ** (6 - idx) for idx in range(7))
+        flip = sum(eo[idx] * 2 ** (10 - idx) for idx in range(11))
+        position = slice_coordinate(ep) // SLICE_PERMUTATIONS
+        estimate = max(self.twist_prune[twist * SLICE_POSITIONS + position], self.flip_prune[flip * SLICE_POSITIONS + position])
+
+        search = _Search(self, cubies, max_length, max_nodes)
+
+        for depth in range(estimate, max_length + 1):
+            if search.best is not None and (depth >= len(search.best) or search.nodes > max_nodes):
+                break
+
+            search.phase1(twist, flip, position, depth, -1, [])
+
+        if search.best is None:
+            raise ValueError(f"No solution of at most {max_length} moves found")
+
+        return " ".join(MOVES[move] for move in search.best)
+
+
+class _Search:
+    """The state of one TwoPhaseSolver.solve call, so concurrent calls can share the tables of the solver."""
+
+    def __init__(self, solver: TwoPhaseSolver, cubies: Cubies, max_length: int, max_nodes: int) -> None:
+        self.solver = solver
+        self.cubies = cubies
+        self.nodes = 0
+        self.max_nodes = max_nodes
+        self.best: Optional[List[int]] = None
+        self.max_length = max_length
+
+
+    def phase1(self, twist: int, flip: int, position: int, togo: int, last: int, moves: List[int]) -> bool:
+        """Search phase 1 solutions of exactly togo more moves, return True to stop the search."""
+
+        if togo == 0:
+            # A solution ending with a phase 2 move was already found one move shorter
+            if moves and moves[-1] in PHASE2_MOVES:
+                return False
+
+            return self.start_phase2(moves)
+
+        if self.best is not None and self.nodes > self.max_nodes:
+            return True
+
+        self.nodes += 1
+        solver = self.solver
+        twist_move, flip_move, position_move = solver.twist_move, solver.flip_move, solver.position_move
+        twist_prune, flip_prune = solver.twist_prune, solver.flip_prune
+
+        for move, face in FOLLOWING[last]:
+            next_position = position_move[position * 18 + move]
+            next_twist = twist_move[twist * 18 + move]
+
+            if twist_prune[next_twist * SLICE_POSITIONS + next_position] >= togo:
+                continue
+
+            next_flip = flip_move[flip * 18 + move]
+
+            if flip_prune[next_flip * SLICE_POSITIONS + next_position] >= togo:
+                continue
+
+            moves.append(move)
+
+            if self.phase1(next_twist, next_flip, next_position, togo - 1, face, moves):
+                return True
+
+            moves.pop()
+
+        return False
+
+
+    def start_phase2(self, phase1: List[int]) -> bool:
+        """Solve phase 2 after a phase 1 solution, return True when no shorter solution is wanted."""
+
+        limit = min((len(self.best) - 1 if self.best is not None else self.max_length) - len(phase1), PHASE2_MAX_LENGTH)
+
+        if limit < 0:
+            return True
+
+        cp, _, ep, _ = self.cubies
+
+        for move in phase1:
+            move_cp, _, move_ep, _ = self.solver.move_cubies[move]
+            cp = [cp[idx] for idx in move_cp]
+            ep = [ep[idx] for idx in move_ep]
+
+        corners = permutation_rank(cp)
+        edges = permutation_rank(ep[:8])
+        slice_perm = permutation_rank([edge - 8 for edge in ep[8:]])
+        estimate = max(self.solver.corners_prune[corners * SLICE_PERMUTATIONS + slice_perm], self.solver.edges_prune[edges * SLICE_PERMUTATIONS + slice_perm])
+        last = phase1[-1] // 3 if phase1 else -1
+
+        for depth in range(estimate, limit + 1):
+            phase2: List[int] = []
+
+            if self.phase2(corners, edges, slice_perm, depth, last, phase2):
+                self.best = phase1 + phase2
+                log.debug(f"Found a solution of {len(self.best)} moves after {self.nodes} nodes.")
+
+                return self.nodes > self.max_nodes or len(self.best) <= len(phase1)
+
+        return False
+
+
+    def phase2(self, corners: int, edges: int, slice_perm: int, togo: int, last: int, moves: List[int]) -> bool:
+        """Search phase 2 solutions of exactly togo more moves."""
+
+        if togo == 0:
+            return corners == 0 and edges == 0 and slice_perm == 0
+
+        self.nodes += 1
+        solver = self.solver
+        corners_move, edges_move, slice_perm_move = solver.corners_move, solver.edges_move, solver.slice_perm_move
+        corners_prune, edges_prune = solver.corners_prune, solver.edges_prune
+
+        for idx, move, face in PHASE2_FOLLOWING[last]:
+            next_corners = corners_move[corners * 10 + idx]
+            next_slice = slice_perm_move[slice_perm * 10 + idx]
+
+            if corners_prune[next_corners * SLICE_PERMUTATIONS + next_slice] >= togo:
+                continue
+
+            next_edges = edges_move[edges * 10 + idx]
+
+            if edges_prune[next_edges * SLICE_PERMUTATIONS + next_slice] >= togo:
+                continue
+
+            moves.append(move)
+
+            if self.phase2(next_corners, next_edges, next_slice, togo - 1, face, moves):
+                return True
+
+            moves.pop()
+
+        return False
+
+
+def to_cubies(facelets: np.ndarray) -> Cubies:
+    """Convert 54 color codes in Kociemba order to corner and edge permutations and orientations.
+
+    Colors are told apart by the centers, so any color scheme works. Raises
+    ValueError if the facelets are not a solvable cube.
+    """
+
+    faces = {int(facelets[face * 9 + 4]): face for face in range(6)}
+
+    if len(faces) != 6:
+        raise ValueError("The centers do not have six different colors")
+
+    try:
+        face = [faces[int(color)] for color in facelets]
+    except KeyError:
+        raise ValueError("A facelet has a color of no center") from None
+
+    cp, co, ep, eo = [-1] * 8, [0] * 8, [-1] * 12, [0] * 12
+
+    for idx, positions in enumerate(CORNER_FACELETS):
+        for ori in range(3):
+            if face[positions[ori]] in (U, D):
+                break
+
+        colors = [face[positions[(ori + k) % 3]] for k in range(3)]
+
+        for corner, corner_colors in enumerate(CORNER_COLORS):
+            if colors == corner_colors:
+                cp[idx], co[idx] = corner, ori
+
+    for idx, positions in enumerate(EDGE_FACELETS):
+        colors = [face[position] for position in positions]
+
+        for edge, edge_colors in enumerate(EDGE_COLORS):
+            if colors == edge_colors:
+                ep[idx], eo[idx] = edge, 0
+
+            elif colors == edge_colors[::-1]:
+                ep[idx], eo[idx] = edge, 1
+
+    if sorted(cp) != list(range(8)) or sorted(ep) != list(range(12)):
+        raise ValueError("The corners or edges are not a permutation of the pieces")
+
+    if sum(co) % 3 or sum(eo) % 2 or parity(cp) != parity(ep):
+        raise ValueError("The cube is not solvable")
+
+    return cp, co, ep, eo
+
+
+def parity(permutation: List[int]) -> int:
+
+    return sum(permutation[j] < permutation[i] for i in range(len(permutation)) for j in range(i + 1, len(permutation))) % 2
+
+
+def permutation_rank(permutation: List[int]) -> int:
+    """Lexicographic rank of a permutation of 0..n-1, the index in itertools.permutations."""
+
+    rank = 0
+
+    for i, value in enumerate(permutation):
+        rank = rank * (len(permutation) - i) + sum(other < value for other in permutation[i + 1:])
+
+    return rank
+
+
+def slice_coordinate(ep: List[int]) -> int:
+    """Positions of the FR, FL, BL, BR edges as a combination rank, times 24, plus their order."""
+
+    positions = [idx for idx, edge in enumerate(ep) if edge >= 8]
+    rank = sum(math.comb(position, k + 1) for k, position in enumerate(positions))
+
+    return rank * SLICE_PERMUTATIONS + permutation_rank([ep[position] - 8 for position in positions])
+
+
+def build_move_cubies() -> List[Cubies]:
+    """Read the cubie permutations and orientations of the 18 face turns off the verifier tables."""
+
+    verifier = Verifier(3)
+    solved = np.repeat(np.arange(6, dtype=np.uint8), 9)[np.argsort(KOCIEMBA_ORDER)]
+
+    return [to_cubies(solved[verifier.table(move)][KOCIEMBA_ORDER]) for move in MOVES]
+
+
+def generate_tables() -> Dict[str, np.ndarray]:
+    """Generate the move tables of the coordinates and the four pruning tables."""
+
+    move_cubies = build_move_cubies()
+    cp_moves = np.array([cubies[0] for cubies in move_cubies])
+    co_moves = np.array([cubies[1] for cubies in move_cubies])
+    ep_moves = np.array([cubies[2] for cubies in move_cubies])
+    eo_moves = np.array([cubies[3] for cubies in move_cubies])
+
+    # Twist: the orientations of the first 7 corners in base 3
+    co = np.stack([np.arange(TWISTS) // 3 ** (6 - idx) % 3 for idx in range(7)], axis=1)
+    co = np.concatenate([co, (-co.sum(axis=1) % 3)[:, None]], axis=1)
+    twist_move = np.stack([
+        ((co[:, cp_moves[move]] + co_moves[move]) % 3)[:, :7] @ (3 ** np.arange(6, -1, -1))
+        for move in range(18)
+    ], axis=1)
+
+    # Flip: the orientations of the first 11 edges in base 2
+    eo = np.stack([np.arange(FLIPS) // 2 ** (10 - idx) % 2 for idx in range(11)], axis=1)
+    eo = np.concatenate([eo, (eo.sum(axis=1) % 2)[:, None]], axis=1)
+    flip_move = np.stack([
+        ((eo[:, ep_moves[move]] + eo_moves[move]) % 2)[:, :11] @ (2 ** np.arange(10, -1, -1))
+        for move in range(18)
+    ], axis=1)
+
+    # Slice: where the FR, FL, BL, BR edges are and in which order, the other edges do not matter
+    combinations = np.array(list(itertools.combinations(range(12), 4)))
+    combination_ranks = sum(np.vectorize(math.comb)(combinations[:, k], k + 1) for k in range(4))
+    combinations = combinations[np.argsort(combination_ranks)]
+    orders = np.array(list(itertools.permutations(range(4))))
+
+    ep = np.zeros((SLICE_POSITIONS * SLICE_PERMUTATIONS, 12), dtype=np.int64)
+    rows = np.arange(len(ep))
+    ep[rows[:, None], combinations[rows // SLICE_PERMUTATIONS]] = 8 + orders[rows % SLICE_PERMUTATIONS]
+    slice_move = np.stack([slice_coordinates(ep[:, ep_moves[move]]) for move in range(18)], axis=1)
+
+    # Phase 2: corner permutation, permutation of the U and D edges, order of the slice edges
+    permutations = np.array(list(itertools.permutations(range(8))))
+    corners_move = np.stack([permutation_ranks(permutations[:, cp_moves[move]]) for move in PHASE2_MOVES], axis=1)
+    edges_move = np.stack([permutation_ranks(permutations[:, ep_moves[move][:8]]) for move in PHASE2_MOVES], axis=1)
+    slice_perm_move = np.stack([
+        slice_move[SOLVED_SLICE * SLICE_PERMUTATIONS + np.arange(SLICE_PERMUTATIONS), move] - SOLVED_SLICE * SLICE_PERMUTATIONS
+        for move in PHASE2_MOVES
+    ], axis=1)
+
+    slice_position_move = slice_move[::SLICE_PERMUTATIONS] // SLICE_PERMUTATIONS
+    return {
+        "twist_move": twist_move.astype(np.uint16),
+        "flip_move": flip_move.astype(np.uint16),
+        "position_move": slice_position_move.astype(np.uint16),
+        "corners_move": corners_move.astype(np.uint16),
+        "edges_move": edges_move.astype(np.uint16),
+        "slice_perm_move": slice_perm_move.astype(np.uint8),
+        "twist_prune": prune(twist_move, slice_position_move, SOLVED_SLICE),
+        "flip_prune": prune(flip_move, slice_position_move, SOLVED_SLICE),
+        "corners_prune": prune(corners_move, slice_perm_move, 0),
+        "edges_prune": prune(edges_move, slice_perm_move, 0),
+    }
+
+
+def slice_coordinates(ep: np.ndarray) -> np.ndarray:
+    """slice_coordinate of every row of an (N, 12) edge permutation array."""
+
+    is_slice = ep >= 8
+    positions = np.nonzero(is_slice)[1].reshape(-1, 4)
+    rank = sum(np.vectorize(math.comb)(positions[:, k], k + 1) for k in range(4))
+    order = np.take_along_axis(ep, positions, axis=1) - 8
+
+    return rank * SLICE_PERMUTATIONS + permutation_ranks(order)
+
+
+def permutation_ranks(permutations: np.ndarray) -> np.ndarray:
+    """permutation_rank of every row of an (N, n) array."""
+
+    count = permutations.shape[1]
+    rank = np.zeros(len(permutations), dtype=np.int64)
+
+    for i in range(count):
+        smaller = (permutations[:, i + 1:] < permutations[:, i:i + 1]).sum(axis=1)
+        rank = rank * (count - i) + smaller
+
+    return rank
+
+
+def prune(first_move: np.ndarray, second_move: np.ndarray, second_solved: int) -> np.ndarray:
+    """Breadth-first distances to the solved pair over (first, second) coordinate pairs, indexed first * len(second) + second."""
+
+    size = len(second_move)
+    table = np.full(len(first_move) * size, 255, dtype=np.uint8)
+    frontier = np.array([second_solved], dtype=np.int64)
+    table[frontier] = 0
+    depth = 0
+
+    while len(frontier):
+        neighbours = (first_move[frontier // size].astype(np.int64) * size + second_move[frontier % size]).ravel()
+        neighbours = np.unique(neighbours[table[neighbours] == 255])
+
+        depth += 1
+        table[neighbours] = depth
+        frontier = neighbours
+
+    return table
+
+
+def save_tables(tables: Dict[str, np.ndarray], directory: str, path: str) -> None:
+    """Write the tables to path through a temporary directory."""
+
+    os.makedirs(directory, exist_ok=True)
+    tmp = tempfile.mkdtemp(prefix=".tmp-", dir=directory)
+
+    try:
+        for name, table in tables.items():
+            np.save(os.path.join(tmp, f"{name}.npy"), np.ascontiguousarray(table))
+
+        try:
+            os.replace(tmp, path)
+        except OSError:
+            # Another process saved the tables in the meantime
+            if not os.path.isdir(path):
+                raise
+
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    log.info(f"Saved two-phase tables to {path}")
@@ -0,0 +1,348 @@
+import logging
+import math
+import re
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+from magiccube import Cube
+from magiccube.cube_base import CubeException
+from magiccube.cube_move import CubeMove, CubeMoveType
+
+from bot.judge.corpus import COLORS
+
+
+log = logging.getLogger(__name__)
+
+FACE_MOVES = (CubeMoveType.L, CubeMoveType.R, CubeMoveType.D, CubeMoveType.U, CubeMoveType.B, CubeMoveType.F)
+SLICE_MOVES = (CubeMoveType.M, CubeMoveType.E, CubeMoveType.S)
+CUBE_ROTATIONS = (CubeMoveType.X, CubeMoveType.Y, CubeMoveType.Z)
+
+# The axis every move type turns about, moves about the same axis commute
+AXES = {
+    CubeMoveType.L: 0, CubeMoveType.R: 0, CubeMoveType.M: 0, CubeMoveType.X: 0,
+    CubeMoveType.D: 1, CubeMoveType.U: 1, CubeMoveType.E: 1, CubeMoveType.Y: 1,
+    CubeMoveType.B: 2, CubeMoveType.F: 2, CubeMoveType.S: 2, CubeMoveType.Z: 2,
+}
+
+# The grammar of CubeMove.create: layer prefix, face and wide flag or a slice or rotation, prime, double.
+# It is matched the same way, with match and $, so a token may end with one newline.
+TOKEN = re.compile(r"([0-9]*)(?:([LRDUBF])(w?)|([xyzXYZMES]))(')?(2?)$")
+
+# Steps counted for a move of 0, 1, 2 and 3 clockwise quarter turns
+METRICS = {
+    "HTM": (0, 1, 1, 1),
+    "QTM": (0, 1, 2, 1),
+}
+
+MoveKey = Tuple[CubeMoveType, bool, int]
+
+# A parsed move: the id of its quarter turn and the number of clockwise quarter turns, 1 to 3
+Move = Tuple[int, int]
+
+
+class Verifier:
+    """Apply move sequences to facelet arrays with precomputed permutation tables.
+
+    A state is a uint8 array of 6*n*n color codes in magiccube's get() order
+    (U, L, F, R, B, D). Every move is a permutation of the facelets, so applying
+    it is a single gather: state[table]. The tables are read off magiccube
+    itself, which keeps the verdicts identical to Cube.rotate and Cube.is_done.
+    """
+
+    def __init__(self, size: int, metric: str="HTM") -> None:
+        self.size = size
+        self.facelets = 6 * size * size
+        self.metric = METRICS[metric]
+
+        # Quarter turn tables keyed by (type, wide, layer), and full move tables keyed by token
+        self.base_tables: Dict[MoveKey, np.ndarray] = {}
+        self.tables: Dict[str, np.ndarray] = {}
+
+        # Distinct quarter turns, equivalent spellings such as R, 1Rw and 3L' on a 3x3 share one id
+        self.quarters: List[np.ndarray] = []
+        self.quarter_axes: List[int] = []
+        self.quarter_ids: Dict[bytes, int] = {}
+        self.powers: Dict[Move, np.ndarray] = {}
+        self.tokens: Dict[str, Move] = {}
+
+        for move_type in FACE_MOVES:
+            for layer in range(1, size + 1):
+                for wide in (False, True):
+                    self.base_table(move_type, wide, layer)
+
+        for move_type in CUBE_ROTATIONS + (SLICE_MOVES if size % 2 == 1 else ()):
+            self.base_table(move_type, False, 1)
+
+
+    def probe(self, move: CubeMove) -> np.ndarray:
+        """Read the permutation of a move off magiccube.
+
+        Every facelet is labelled with its index written in base 6, one digit per
+        color, and each digit is recovered after the move in a separate pass.
+        """
+
+        digits = math.ceil(math.log(self.facelets, 6))
+        index = np.arange(self.facelets)
+        table = np.zeros(self.facelets, dtype=np.intp)
+
+        for digit in range(digits):
+            labels = (index // 6 ** digit) % 6
+            cube = Cube(self.size, "".join(COLORS[label] for label in labels), hist=False)
+            cube.rotate([move])
+            table += np.array([COLORS.index(color) for color in cube.get()]) * 6 ** digit
+
+        if len(np.unique(table)) != self.facelets:
+            raise CubeException(f"move {move} is not a permutation of the facelets")
+
+        return table
+
+
+    def base_table(self, move_type: CubeMoveType, wide: bool, layer: int) -> np.ndarray:
+        """Return the table of the clockwise quarter turn."""
+
+        key = (move_type, wide, layer)
+
+        if key not in self.base_tables:
+            self.base_tables[key] = self.probe(CubeMove(move_type, False, wide, layer))
+
+        return self.base_tables[key]
+
+
+    def table(self, token: str) -> np.ndarray:
+        """Return the table of a move token such as R, U', 2Rw2 or x."""
+
+        if token in self.tables:
+            return self.tables[token]
+
+        move = CubeMove.create(token)
+        table = self.base_table(move.type, move.wide, move.layer)
+
+        if move.is_reversed:
+            table = np.argsort(table)
+
+        result = np.arange(self.facelets)
+
+        for _ in range(move.count):
+            result = result[table]
+
+        self.tables[token] = result
+
+        return result
+
+
+    def token(self, token: str, position: int) -> Move:
+        """Parse one move token, position is only used in the error messages."""
+
+        if token in self.tokens:
+            return self.tokens[token]
+
+        match = TOKEN.match(token)
+
+        if match is None:
+            raise CubeException(f"invalid move {token!r} at move {position}")
+
+        prefix, face, wide, special, prime, double = match.groups()
+
+        if special is not None:
+            if special in "MES" and self.size % 2 == 0:
+                raise CubeException(f"slice move {token!r} at move {position} is not allowed on a {self.size}x{self.size} cube")
+
+            key = (CubeMoveType.create(special.upper()), False, 1)
+
+        else:
+            layer = int(prefix) if prefix else (2 if wide else 1)
+
+            if not 1 <= layer <= self.size:
+                raise CubeException(f"move {token!r} at move {position} turns layer {layer}, but the cube has {self.size} layers")
+
+            # 1Rw is R
+            key = (CubeMoveType.create(face), bool(wide) and layer > 1, layer)
+
+        move = self.quarter(key)
+        turns = (move[1] * (2 if double else 1) * (-1 if prime else 1)) % 4
+
+        # An unbounded number of layer prefixes like 001R spell the same move
+        if len(token) <= 8:
+            self.tokens[token] = (move[0], turns)
+
+        return move[0], turns
+
+
+    def quarter(self, key: MoveKey) -> Move:
+        """Return the quarter turn id of a clockwise quarter turn and 1, or 3 if it is the inverse of a known one."""
+
+        table = self.base_table(*key)
+        code = table.tobytes()
+
+        if code in self.quarter_ids:
+            return self.quarter_ids[code], 1
+
+        inverse = np.argsort(table).tobytes()
+
+        if inverse in self.quarter_ids:
+            return self.quarter_ids[inverse], 3
+
+        self.quarter_ids[code] = len(self.quarters)
+        self.quarters.append(table)
+        self.quarter_axes.append(AXES[key[0]])
+
+        return len(self.quarters) - 1, 1
+
+
+    def parse(self, moves: str, normalise: bool=True) -> List[Move]:
+        """Tokenize, validate and cancel a move string in a single pass.
+
+        Tokens are separated by spaces like Cube.rotate does and follow its
+        grammar. An invalid token raises CubeException naming the token and its
+        position. With normalise, a move is merged into the last move of the same
+        layer as long as only moves about the same axis lie in between, since
+        those commute, so "R L R'" becomes "L" and "U U'" disappears.
+        """
+
+        result: List[Move] = []
+        position = 0
+
+        for token in moves.split(" "):
+            if token == "":
+                continue
+
+            position += 1
+            move, turns = self.token(token, position)
+
+            if not normalise:
+                result.append((move, turns))
+                continue
+
+            axis = self.quarter_axes[move]
+            idx = len(result) - 1
+
+            while idx >= 0 and result[idx][0] != move and self.quarter_axes[result[idx][0]] == axis:
+                idx -= 1
+
+            if idx >= 0 and result[idx][0] == move:
+                turns = (result[idx][1] + turns) % 4
+
+                if turns == 0:
+                    del result[idx]
+                else:
+                    result[idx] = (move, turns)
+
+            elif turns:
+                result.append((move, turns))
+
+        return result
+
+
+    def steps(self, moves: List[Move]) -> int:
+        """Count parsed moves in the metric of the verifier, HTM counts every move once and QTM half turns twice."""
+
+        return sum(self.metric[turns] for _, turns in moves)
+
+
+    def power(self, move: Move) -> np.ndarray:
+        """Return the table of a parsed move."""
+
+        if move not in self.powers:
+            table = self.quarters[move[0]]
+            result = table
+
+            for _ in range(move[1] - 1):
+                result = result[table]
+
+            self.powers[move] = result
+
+        return self.powers[move]
+
+
+    def apply(self, state: np.ndarray, moves: str) -> np.ndarray:
+        """Return the state after the moves, only the moves left after cancellation are applied."""
+
+        for move in self.parse(moves):
+            state = state[self.power(move)]
+
+        return state
+
+
+    def is_solved(self, state: np.ndarray) -> bool:
+        """Return True if every face has a single color."""
+
+        faces = np.asarray(state).reshape(6, -1)
+
+        return bool((faces == faces[:, :1]).all())
+
+
+    def verify(self, state: np.ndarray, moves: str) -> bool:
+        """Return True if the moves solve the state."""
+
+        return self.verify_steps(state, moves)[0]
+
+
+    def verify_steps(self, state: np.ndarray, moves: str) -> Tuple[bool, int]:
+        """Return whether the moves solve the state and their step count after cancellation."""
+
+        parsed = self.parse(moves)
+        state = np.asarray(state)
+
+        for move in parsed:
+            state = state[self.power(move)]
+
+        return self.is_solved(state), self.steps(parsed)
+
+
+    def verify_batch(self, states: np.ndarray, moves: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """Verify N (state, moves) pairs at once.
+
+        states is an (N, 6*n*n) array and moves holds N move strings. Every move
+        string is turned into a row of table ids, padded with the identity, and the
+        whole batch advances one move per step with a single take_along_axis.
+
+        Returns the solved mask and the step counts after cancellation. Pairs
+        with an invalid token are reported as unsolved with -1 steps.
+        """
+
+        states = np.asarray(states)
+        count = len(moves)
+
+        if states.shape != (count, self.facelets):
+            raise ValueError(f"states should have shape ({count}, {self.facelets}), got {states.shape}")
+
+        # Table 0 is the identity used as padding
+        vocabulary: Dict[Move, int] = {}
+        tables = [np.arange(self.facelets)]
+        rows = []
+        steps = np.zeros(count, dtype=np.int64)
+        valid = np.ones(count, dtype=bool)
+
+        for idx, sequence in enumerate(moves):
+            try:
+                parsed = self.parse(sequence)
+
+            except CubeException:
+                valid[idx] = False
+                rows.append([])
+                continue
+
+            for move in parsed:
+                if move not in vocabulary:
+                    tables.append(self.power(move))
+                    vocabulary[move] = len(tables) - 1
+
+            rows.append([vocabulary[move] for move in parsed])
+            steps[idx] = self.steps(parsed)
+
+        lengths = np.array([len(row) for row in rows], dtype=np.int64)
+        move_ids = np.zeros((count, lengths.max(initial=0)), dtype=np.intp)
+
+        for idx, row in enumerate(rows):
+            move_ids[idx, :len(row)] = row
+
+        tables = np.stack(tables)
+
+        for step in range(move_ids.shape[1]):
+            states = np.take_along_axis(states, tables[move_ids[:, step]], axis=1)
+
+        faces = states.reshape(count, 6, self.size * self.size)
+        solved = (faces == faces[:, :, :1]).all(axis=(1, 2)) & valid
+        steps[~valid] = -1
+
+        return solved, steps
@@ -1,4 +1,6 @@
 import logging
+from collections import OrderedDict
+from typing import Awaitable, Callable, Sequence, Tuple
 
 import discord
 from discord.ext import commands
@@ -6,34 +8,84 @@ from discord.ext import commands
 
 log = logging.getLogger(__name__)
 
+PageProvider = Callable[[int, int], Awaitable[list]]
+
+
 class PageButton(discord.ui.View):
+    """Paged embed fields, either sliced from data or fetched page by page from a provider.
     
-    def __init__(self, embed: discord.Embed, data: list, limit: int, ctx: discord.ApplicationContext=None):
+    A provider is an async callback (offset, limit) -> fields. It is asked for one
+    field more than a page holds, so that the view knows whether a next page exists.
+    """
+    
+    def __init__(self, embed: discord.Embed, data: Sequence=None, limit: int=5, ctx: discord.ApplicationContext=None, provider: PageProvider=None, cache_size: int=8):
         super().__init__()
         self.ctx = ctx
         self.embed = embed
         self.index = 0
         self.data = data
         self.limit = limit
+        self.provider = provider
+        self.cache_size = cache_size
+        self.pages: OrderedDict[int, Tuple[discord.Embed, bool]] = OrderedDict()
         
-        if self.index + self.limit >= len(self.data):
+        if self.data is None or self.index + self.limit >= len(self.data):
             for child in self.children:
                 if child.custom_id == "next": child.disabled = True
                 
         if self.index - self.limit < 0:
             for child in self.children:
                 if child.custom_id == "previous": child.disabled = True
-            
-            
-    def get_embed(self) -> discord.Embed:
-        
+                
+                
+    def render(self, fields: list) -> discord.Embed:
+    
         embed = self.embed.copy()
         
-        for field in self.data[self.index:self.index + self.limit]:
+        for field in fields:
             embed.add_field(**field)
             
         return embed
+        
+        
+    def get_embed(self) -> discord.Embed:
+    
+        return self.render(self.data[self.index:self.index + self.limit])
+        
+        
+    async def fetch(self, index: int) -> Tuple[discord.Embed, bool]:
+        """Return the rendered page at index and whether a next page exists."""
+        
+        if index in self.pages:
+            self.pages.move_to_end(index)
+            return self.pages[index]
+            
+        if self.provider is None:
+            page = self.render(self.data[index:index + self.limit]), index + self.limit < len(self.data)
+            
+        else:
+            fields = await self.provider(index, self.limit + 1)
+            page = self.render(fields[:self.limit]), len(fields) > self.limit
+            
+        self.pages[index] = page
+        
+        if len(self.pages) > self.cache_size:
+            self.pages.popitem(last=False)
+            
+        return page
+        
+        
+    async def load(self) -> discord.Embed:
+        """Fetch the current page and update the buttons."""
+        
+        embed, has_next = await self.fetch(self.index)
+        
+        for child in self.children:
+            if child.custom_id == "next": child.disabled = not has_next
+            if child.custom_id == "previous": child.disabled = self.index - self.limit < 0
             
+        return embed
+        
         
     def on_timeout(self) -> discord.Coroutine[discord.Any, discord.Any, None]:
         self.disable_all_items()
@@ -41,44 +93,29 @@ class PageButton(discord.ui.View):
         
     @discord.ui.button(label="上一頁", style=discord.ButtonStyle.primary, custom_id="previous")
     async def previous(self, button: discord.ui.Button, interaction: discord.Interaction):
-        
+    
         if self.ctx is not None and interaction.user != self.ctx.author:
             await interaction.response.send_message("我剛剛查資料的時候...你偷看了罷...", ephemeral=True)
             return
+            
+        self.index -= self.limit
+        embed = await self.load()
         
-        embed = self.embed.copy()
+        # Ephemeral messages can only be edited through the interaction response
+        await interaction.response.edit_message(embed=embed, view=self)
         
-        self.index -= self.limit
-        for field in self.data[self.index:self.index + self.limit]:
-            embed.add_field(**field)
-            
-        for child in self.children:
-            if child.custom_id == "next": child.disabled = False
-            
-        button.disabled = self.index - self.limit < 0
-            
-        await interaction.message.edit(embed=embed, view=self)
-        await interaction.response.defer()
         
-
     @discord.ui.button(label="下一頁", style=discord.ButtonStyle.primary, custom_id="next")
     async def next(self, button: discord.ui.Button, interaction: discord.Interaction):
-        
+    
         if self.ctx is not None and interaction.user != self.ctx.author:
             await interaction.response.send_message("我剛剛查資料的時候...你偷看了罷...", ephemeral=True)
             return
-        
-        embed = self.embed.copy()
-        
+            
         self.index += self.limit
-        for field in self.data[self.index:self.index + self.limit]:
-            embed.add_field(**field)
+        embed = await self.load()
+        
+        # Ephemeral messages can only be edited through the interaction response
+        await interaction.response.edit_message(embed=embed, view=self)
         
-        for child in self.children:
-            if child.custom_id == "previous": child.disabled = False
-                
-        button.disabled = self.index + self.limit >= len(self.data)
-            
-        await interaction.message.edit(embed=embed, view=self)
-        await interaction.response.defer()
         
\ No newline at end of file
@@ -0,0 +1,168 @@
+import os
+import json
+from typing import Iterator, List, Tuple
+
+import numpy as np
+
+from bot.judge.corpus import COLORS
+
+
+FORMAT_VERSION = 1
+
+
+class DatasetWriter:
+    """Write (state, move) pairs as a directory of .npy shards, one shard at a time.
+
+    Layout of a dataset directory:
+        meta.json      format, colors, move names, count and the shards
+        NNNNN.x.npy    (n, facelets) uint8 color codes
+        NNNNN.y.npy    (n,) uint8 move class indexes
+
+    meta.json is rewritten after every shard, so an interrupted run leaves a
+    readable dataset of the shards written so far.
+    """
+
+    def __init__(self, path: str, moves: List[str], facelets: int=54) -> None:
+        self.path = path
+        self.meta = {
+            "format": FORMAT_VERSION,
+            "colors": COLORS,
+            "moves": moves,
+            "facelets": facelets,
+            "count": 0,
+            "shards": [],
+        }
+
+        os.makedirs(path, exist_ok=True)
+
+        # Shards of a previous run would be mistaken for ours
+        for filename in os.listdir(path):
+            if filename.endswith((".x.npy", ".y.npy")):
+                os.remove(os.path.join(path, filename))
+
+
+    def __enter__(self) -> "DatasetWriter":
+        return self
+
+
+    def __exit__(self, *exc) -> None:
+        self.write_meta()
+
+
+    def write(self, x: np.ndarray, y: np.ndarray) -> None:
+        """Append one shard."""
+
+        if len(x) != len(y):
+            raise ValueError(f"x has {len(x)} rows but y has {len(y)}")
+
+        if len(x) == 0:
+            return
+
+        name = f"{len(self.meta['shards']):05d}"
+        np.save(os.path.join(self.path, f"{name}.x.npy"), np.ascontiguousarray(x, dtype=np.uint8))
+        np.save(os.path.join(self.path, f"{name}.y.npy"), np.ascontiguousarray(y, dtype=np.uint8))
+
+        self.meta["shards"].append({"name": name, "count": len(x)})
+        self.meta["count"] += len(x)
+        self.write_meta()
+
+
+    def write_meta(self) -> None:
+
+        tmp = os.path.join(self.path, "meta.json.tmp")
+
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.meta, f, indent=4)
+
+        os.replace(tmp, os.path.join(self.path, "meta.json"))
+
+
+class Dataset:
+    """Read a dataset directory written by DatasetWriter, the shards are memory-mapped."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+
+        if self.meta["format"] != FORMAT_VERSION:
+            raise ValueError(f"Unsupported dataset format {self.meta['format']} in {path}")
+
+        self.moves: List[str] = self.meta["moves"]
+        self.shards = [
+            (
+                np.load(os.path.join(path, f"{shard['name']}.x.npy"), mmap_mode="r"),
+                np.load(os.path.join(path, f"{shard['name']}.y.npy"), mmap_mode="r"),
+            )
+            for shard in self.meta["shards"]
+        ]
+
+
+    def __len__(self) -> int:
+
+        return self.meta["count"]
+
+
+    def batches(self, batch_size: int, shuffle: bool=False, seed: int=None, drop_last: bool=False) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """Yield (x, y) batches, only the rows of the current batch are read from disk.
+
+        With shuffle the order of the shards and the rows inside every shard are
+        permuted, which keeps the reads within one shard at a time.
+        """
+
+        rng = np.random.default_rng(seed)
+        order = rng.permutation(len(self.shards)) if shuffle else range(len(self.shards))
+
+        x_rest = np.empty((0, self.meta["facelets"]), dtype=np.uint8)
+        y_rest = np.empty(0, dtype=np.uint8)
+
+        for idx in order:
+            x, y = self.shards[idx]
+            rows = rng.permutation(len(x)) if shuffle else None
+
+            def take(start: int, stop: int) -> Tuple[np.ndarray, np.ndarray]:
+                if rows is None:
+                    return np.array(x[start:stop]), np.array(y[start:stop])
+
+                return x[rows[start:stop]], y[rows[start:stop]]
+
+            start = 0
+
+            # Complete the batch left over from the previous shard
+            if len(x_rest):
+                start = batch_size - len(x_rest)
+                x_head, y_head = take(0, start)
+                x_rest, y_rest = np.concatenate((x_rest, x_head)), np.concatenate((y_rest, y_head))
+
+                if len(x_rest) < batch_size:
+                    continue
+
+                yield x_rest, y_rest
+                x_rest, y_rest = x_rest[:0], y_rest[:0]
+
+            for start in range(start, len(x), batch_size):
+                x_batch, y_batch = take(start, start + batch_size)
+
+                if len(x_batch) < batch_size:
+                    x_rest, y_rest = x_batch, y_batch
+                    break
+
+                yield x_batch, y_batch
+
+        if len(x_rest) and not drop_last:
+            yield x_rest, y_rest
+
+
+def to_float(x: np.ndarray, values: np.ndarray=None) -> np.ndarray:
+    """Turn color codes into float features, by default 0.0, 0.2, ..., 1.0 in the order of COLORS."""
+
+    values = np.linspace(0.0, 1.0, len(COLORS)) if values is None else values
+
+    return values[x]
+
+
+def one_hot(y: np.ndarray, classes: int) -> np.ndarray:
+    """Turn move class indexes into one-hot rows."""
+
+    return np.eye(classes)[y]
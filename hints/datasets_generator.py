@@ -1,76 +1,182 @@
 import os
-import json
+import sys
+import random
+import argparse
+import concurrent.futures
+from typing import Iterator
 
 import numpy as np
 from magiccube import Cube
 from magiccube.solver.basic.basic_solver import BasicSolver
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-COLOR_CODE = {
-    "R": 0.0,
-    "O": 0.2,
-    "W": 0.4,
-    "Y": 0.6,
-    "B": 0.8,
-    "G": 1.0
-}
+from bot.config import CUBE_SIZE
+from bot.judge.verifier import Verifier
+from hints.dataset import DatasetWriter
+from hints.encoding import Encoder, FACES
+
+
+# Scrambles generated by one task of the pool
+SHARD_SIZE = 64
+
+encoder: Encoder = None
+
+
+def init_worker(size: int) -> None:
+    """Build the move tables once per worker process."""
+
+    global encoder
+    encoder = Encoder(size)
+
+
+def basic_shard(count: int, length: int, seed: int) -> dict:
+    """Generate count 3x3 scrambles and the (state, move) pairs along their BasicSolver solutions.
+
+    Only the scramble is read off magiccube, the states along the solution are
+    advanced with the move tables of the encoder, one gather per move.
+    """
+
+    random.seed(seed)
+
+    capacity = count * 128
+    x = np.empty((capacity, encoder.facelets), dtype=np.uint8)
+    y = np.empty(capacity, dtype=np.uint8)
+    states = np.empty((count, encoder.facelets), dtype=np.uint8)
+    solutions = []
+    size = 0
+
+    for idx in range(count):
+        cube = Cube(encoder.size)
+        cube.scramble(length)
+        state = encoder.encode(cube)
+        states[idx] = state
+
+        solution = [encoder.encode_move(move) for move in BasicSolver(cube).solve()]
+        solutions.append(" ".join(encoder.moves[move] for move in solution))
+
+        if size + len(solution) > capacity:
+            capacity = max(capacity * 2, size + len(solution))
+            x = np.resize(x, (capacity, encoder.facelets))
+            y = np.resize(y, capacity)
+
+        for move in solution:
+            x[size] = state
+            y[size] = move
+            state = state[encoder.tables[move]]
+            size += 1
+
+        if not encoder.verifier.is_solved(state):
+            raise RuntimeError(f"Generated solution {solutions[-1]} does not solve its cube.")
+
+    return {"x": x[:size], "y": y[:size], "states": states, "solutions": solutions}
+
+
+def inverse_shard(count: int, length: int, seed: int) -> dict:
+    """Generate count random scrambles of any size, solved by undoing the scramble.
+
+    The whole shard is advanced at once: scramble step k applies one gather to
+    all count states. Consecutive moves never turn the same face, so no move
+    cancels the previous one. The pairs are the states after every scramble
+    move with the inverse of that move, in the order of the solution.
+    """
+
+    rng = np.random.default_rng(seed)
+    faces = len(FACES)
+    variants = len(encoder.moves) // (faces * 3)
+
+    face = np.empty((count, length), dtype=np.intp)
+    face[:, 0] = rng.integers(faces, size=count)
+
+    for step in range(1, length):
+        face[:, step] = (face[:, step - 1] + rng.integers(1, faces, size=count)) % faces
+
+    # Move index = (suffix * variants + variant) * faces + face, the order of move_names
+    moves = (rng.integers(3, size=(count, length)) * variants + rng.integers(variants, size=(count, length))) * faces + face
 
-MOVE_CODE = {
-    "U": 0,
-    "D": 1,
-    "L": 2,
-    "R": 3,
-    "F": 4,
-    "B": 5,
-    "U'": 6,
-    "D'": 7,
-    "L'": 8,
-    "R'": 9,
-    "F'": 10,
-    "B'": 11
+    x = np.empty((count, length, encoder.facelets), dtype=np.uint8)
+    state = np.tile(encoder.solved, (count, 1))
+
+    for step in range(length):
+        state = encoder.apply(state, moves[:, step])
+        x[:, step] = state
+
+    # Undo the scramble from the last move to the first
+    x = x[:, ::-1]
+    y = encoder.inverse[moves[:, ::-1]]
+    solutions = [" ".join(encoder.moves[move] for move in row) for row in y]
+
+    return {
+        "x": x.reshape(-1, encoder.facelets),
+        "y": y.reshape(-1).astype(np.uint8),
+        "states": x[:, 0].copy(),
+        "solutions": solutions,
+    }
+
+
+SOLVERS = {
+    "basic": basic_shard,
+    "inverse": inverse_shard,
 }
 
-x_trains = []
-y_trains = []
-data_count = 100
-
-for i in range(data_count):
-    cube = Cube(3)
-    cube.scramble(20)
-    solver = BasicSolver(cube)
-    solution = solver.solve()
-    
-    x_train = []
-    
-    for step in solution:
-        output = []
-        for Coordinates, CubePiece in cube.get_all_pieces().items():
-            output.extend([COLOR_CODE[s] for s in CubePiece.get_piece_colors_str()])
-        x_train.append(np.array(output).reshape(-1))
-        cube.rotate(str(step))
-        
-    x_train = np.array(x_train).reshape(-1, 54)
-    y_train = np.array([np.eye(len(MOVE_CODE))[MOVE_CODE[str(s)]] for s in solution]).reshape(-1, len(MOVE_CODE))
-    
-    x_trains.extend(x_train)
-    y_trains.extend(y_train)
-    
-    print(f"{i + 1}/{data_count} data generated.")
-    
-    
-with open(os.path.join(os.path.dirname(__file__), "train.json"), "wb") as f:
-    
-    class NumpyArrayEncoder(json.JSONEncoder):
-        def default(self, obj):
-            if isinstance(obj, np.ndarray):
-                return obj.tolist()
-            return json.JSONEncoder.default(self, obj)
-        
-    f.write(json.dumps({
-        "x_train": x_trains,
-        "y_train": y_trains
-    }, cls=NumpyArrayEncoder).encode("utf-8"))
-    
-    
-print("Data generated successfully.")
-print(f"Data count: {len(x_trains)}")
\ No newline at end of file
+
+def generate(count: int, length: int=20, size: int=CUBE_SIZE, solver: str="basic", workers: int=None, seed: int=0) -> Iterator[dict]:
+    """Generate the dataset over a process pool and yield the shards in order.
+
+    Every shard has its own seed spawned from seed, so the output only depends
+    on seed and count, not on the number of workers.
+    """
+
+    shards = [min(SHARD_SIZE, count - start) for start in range(0, count, SHARD_SIZE)]
+    seeds = [int(child.generate_state(1)[0]) for child in np.random.SeedSequence(seed).spawn(len(shards))]
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(size,)) as executor:
+        yield from executor.map(SOLVERS[solver], shards, [length] * len(shards), seeds)
+
+
+def main() -> None:
+
+    parser = argparse.ArgumentParser(description="Generate (state, move) training pairs from solved scrambles.")
+    parser.add_argument("--count", type=int, default=100, help="number of scrambles")
+    parser.add_argument("--length", type=int, default=20, help="scramble length")
+    parser.add_argument("--size", type=int, default=CUBE_SIZE, help="cube size, defaults to CUBE_SIZE of the settings")
+    parser.add_argument("--solver", choices=SOLVERS, help="basic (BasicSolver, 3x3 only) or inverse (undo the scramble), defaults to basic for 3x3")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes, defaults to the number of CPUs")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=os.path.join(os.path.dirname(__file__), "dataset"), help="dataset directory")
+    args = parser.parse_args()
+
+    solver = args.solver or ("basic" if args.size == 3 else "inverse")
+
+    if solver == "basic" and args.size != 3:
+        parser.error("the basic solver only solves 3x3 cubes, use --solver inverse")
+
+    main_encoder = Encoder(args.size)
+
+    if len(main_encoder.moves) > 256:
+        parser.error(f"{len(main_encoder.moves)} moves do not fit in uint8 class indexes")
+
+    checker = Verifier(args.size)
+    generated = 0
+
+    # Shards are written as they arrive, only one of them is held in memory
+    with DatasetWriter(args.output, main_encoder.moves, main_encoder.facelets) as writer:
+        for shard in generate(args.count, length=args.length, size=args.size, solver=solver, workers=args.workers, seed=args.seed):
+
+            # Check every solution of the shard in one batch before writing it
+            solved, steps = checker.verify_batch(shard["states"], shard["solutions"])
+
+            if not solved.all():
+                raise RuntimeError(f"{np.count_nonzero(~solved)} generated solutions do not solve their cube.")
+
+            writer.write(shard["x"], shard["y"])
+            generated += len(shard["states"])
+
+            print(f"{generated}/{args.count} data generated.")
+
+    print("Data generated successfully.")
+    print(f"Data count: {writer.meta['count']}")
+
+
+if __name__ == "__main__":
+    main()
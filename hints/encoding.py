@@ -0,0 +1,96 @@
+import os
+import sys
+from typing import Dict, List, Union
+
+import numpy as np
+from magiccube import Cube
+from magiccube.cube_move import CubeMove
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bot.judge.corpus import encode_state
+from bot.judge.verifier import Verifier
+
+
+# Face moves in the order of their class indexes
+FACES = "UDLRFB"
+SUFFIXES = ("", "'", "2")
+
+
+def move_names(size: int) -> List[str]:
+    """All distinct face turns of a size n cube in a fixed order.
+
+    The order is suffix, then layer variant, then face, so for a 3x3 the first
+    twelve are U D L R F B U' D' L' R' F' B' and the double turns follow. The
+    layer variants are the outer face, then for every deeper layer the wide
+    turn (Rw, 3Rw, ...) and the single inner slice (2R, 3R, ...).
+    """
+
+    variants = [""]
+
+    for layer in range(2, size // 2 + 1):
+        variants.append("w" if layer == 2 else f"{layer}w")
+        variants.append(f"{layer}")
+
+    names = []
+
+    for suffix in SUFFIXES:
+        for variant in variants:
+            for face in FACES:
+                if variant.endswith("w"):
+                    names.append(f"{variant[:-1]}{face}w{suffix}")
+                else:
+                    names.append(f"{variant}{face}{suffix}")
+
+    return names
+
+
+class Encoder:
+    """Canonical encoding of the states and moves of a size n cube.
+
+    A state is a uint8 array of the 6*n*n color codes of bot.judge.corpus.COLORS
+    in Cube.get() order: the faces U, L, F, R, B, D, each row by row. A move is
+    its index in move_names(n). The permutation table of every move and the
+    index of its inverse are precomputed, so whole batches of states advance
+    with one gather per step.
+    """
+
+    def __init__(self, size: int) -> None:
+        self.size = size
+        self.facelets = 6 * size * size
+        self.verifier = Verifier(size)
+
+        self.moves = move_names(size)
+        self.move_code: Dict[str, int] = {move: idx for idx, move in enumerate(self.moves)}
+        self.tables = np.stack([self.verifier.table(move) for move in self.moves])
+        self.table_code: Dict[bytes, int] = {table.tobytes(): idx for idx, table in enumerate(self.tables)}
+        self.inverse = np.array([self.table_code[np.argsort(table).tobytes()] for table in self.tables], dtype=np.intp)
+        self.solved = self.encode(Cube(size))
+
+
+    def encode(self, cube: Union[Cube, str]) -> np.ndarray:
+        """Return the color codes of a cube or of a state string."""
+
+        return encode_state(cube.get() if isinstance(cube, Cube) else cube)
+
+
+    def encode_move(self, move: Union[CubeMove, str]) -> int:
+        """Return the class index of a move, equivalent spellings such as 1Rw and R share one index."""
+
+        token = str(move)
+
+        if token not in self.move_code:
+            table = self.verifier.table(token)
+
+            if table.tobytes() not in self.table_code:
+                raise ValueError(f"{token} is not a face turn of a {self.size}x{self.size} cube")
+
+            self.move_code[token] = self.table_code[table.tobytes()]
+
+        return self.move_code[token]
+
+
+    def apply(self, states: np.ndarray, moves: np.ndarray) -> np.ndarray:
+        """Apply one move per state, states is (N, facelets) and moves is (N,)."""
+
+        return np.take_along_axis(states, self.tables[moves], axis=1)
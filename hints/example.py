@@ -2,6 +2,10 @@ from magiccube import Cube
 
 class Solver:
     
+    def setup() -> None:
+        """Optional, runs once before the test cases and is not timed."""
+        ...
+        
     def solve(cube: Cube) -> str:
         ...
         
@@ -0,0 +1,179 @@
+"""Differential tests of the Verifier against magiccube's Cube.rotate and Cube.is_done."""
+
+import random
+
+import numpy as np
+import pytest
+from magiccube import Cube
+from magiccube.cube_base import CubeException
+
+from bot.judge.corpus import decode_state, encode_state
+from bot.judge.verifier import Verifier
+
+
+SIZES = [2, 3, 4, 5]
+STRINGS = 200
+
+FACES = "LRDUBF"
+SPECIALS = "xyzXYZMES"
+INVALID = ["R3", "r", "Rw2'", "R''", "Q", "2", "'", "R\n\n", "\nR", "R\tU", "Rw w", "-1R"]
+
+
+def random_token(rng: random.Random, size: int) -> str:
+    """A token which is mostly valid, with layer prefixes which may be out of range."""
+
+    roll = rng.random()
+
+    if roll < 0.05:
+        return rng.choice(INVALID)
+
+    prefix = rng.choice(["", "", "", str(rng.randint(0, size + 1)), "0" + str(rng.randint(1, size))])
+
+    if roll < 0.25:
+        body = rng.choice(SPECIALS)
+    else:
+        body = rng.choice(FACES) + rng.choice(["", "w"])
+
+    token = prefix + body + rng.choice(["", "'"]) + rng.choice(["", "2"])
+
+    # CubeMove.create matches with $, which accepts one trailing newline
+    if rng.random() < 0.05:
+        token += "\n"
+
+    return token
+
+
+def random_moves(rng: random.Random, size: int, length: int) -> str:
+
+    separators = [" ", " ", " ", "  "]
+    moves = "".join(random_token(rng, size) + rng.choice(separators) for _ in range(length))
+
+    return rng.choice(["", " "]) + moves.rstrip(" ") + rng.choice(["", " "])
+
+
+def inverse(moves: str) -> str:
+    """The inverse of a string of valid tokens, keeping their spelling otherwise."""
+
+    tokens = []
+
+    for token in reversed(moves.split()):
+        if token.endswith("2"):
+            tokens.append(token)
+        elif token.endswith("'"):
+            tokens.append(token[:-1])
+        else:
+            tokens.append(token + "'")
+
+    return " ".join(tokens)
+
+
+def rotate(size: int, state: str, moves: str):
+    """The state after Cube.rotate and whether it is done, None if magiccube rejects the moves."""
+
+    cube = Cube(size, state)
+
+    try:
+        cube.rotate(moves)
+    except CubeException:
+        return None
+
+    return cube.get(), cube.is_done()
+
+
+def scramble(rng: random.Random, size: int) -> str:
+
+    cube = Cube(size)
+    cube.rotate(" ".join(f"{rng.randint(1, size)}{rng.choice(FACES)}{rng.choice(['', chr(39), '2'])}" for _ in range(20)))
+
+    return cube.get()
+
+
+@pytest.mark.parametrize("size", SIZES)
+def test_apply_matches_rotate(size: int) -> None:
+
+    rng = random.Random(size)
+    verifier = Verifier(size)
+
+    for _ in range(STRINGS):
+        state = scramble(rng, size)
+        moves = random_moves(rng, size, rng.randint(0, 12))
+        expected = rotate(size, state, moves)
+
+        try:
+            result = decode_state(verifier.apply(encode_state(state), moves))
+        except CubeException:
+            result = None
+
+        assert (result is None) == (expected is None), moves
+
+        if expected is not None:
+            assert result == expected[0], moves
+            assert verifier.is_solved(encode_state(result)) == expected[1], moves
+
+
+@pytest.mark.parametrize("size", SIZES)
+def test_verify_steps_matches_is_done(size: int) -> None:
+
+    rng = random.Random(100 + size)
+    verifier = Verifier(size)
+
+    for _ in range(STRINGS):
+        moves = random_moves(rng, size, rng.randint(1, 12))
+
+        if rotate(size, Cube(size).get(), moves) is None:
+            continue
+
+        state = rotate(size, Cube(size).get(), moves)[0]
+
+        # Half of the solutions undo the scramble, the others stop one move short
+        solution = inverse(moves)
+
+        if rng.random() < 0.5:
+            solution = " ".join(solution.split(" ")[1:])
+
+        if solution and rng.random() < 0.2:
+            solution += "\n"
+
+        expected = rotate(size, state, solution)
+        assert expected is not None, solution
+
+        solved, steps = verifier.verify_steps(encode_state(state), solution)
+
+        assert solved == expected[1], solution
+        assert steps >= 0
+
+
+@pytest.mark.parametrize("size", SIZES)
+def test_verify_batch_matches_is_done(size: int) -> None:
+
+    rng = random.Random(200 + size)
+    verifier = Verifier(size)
+    states = [scramble(rng, size) for _ in range(STRINGS)]
+    solutions = []
+
+    for state in states:
+        # A valid solution from a fresh scramble cannot be built cheaply, so undo a random walk instead
+        moves = random_moves(rng, size, rng.randint(0, 8))
+        expected = rotate(size, state, moves)
+        solutions.append(moves + " " + inverse(moves) if expected is not None and rng.random() < 0.5 else moves)
+
+    solved, steps = verifier.verify_batch(np.stack([encode_state(state) for state in states]), solutions)
+
+    for idx, (state, moves) in enumerate(zip(states, solutions)):
+        expected = rotate(size, state, moves)
+
+        if expected is None:
+            assert not solved[idx] and steps[idx] == -1, moves
+        else:
+            assert bool(solved[idx]) == expected[1], moves
+            assert steps[idx] == verifier.verify_steps(encode_state(state), moves)[1], moves
+
+
+@pytest.mark.parametrize("moves", ["R U R' U'\n", "R U R' U'\n ", "R\n U R' U'"])
+def test_trailing_newline_is_accepted(moves: str) -> None:
+
+    verifier = Verifier(3)
+    state = Cube(3).get()
+
+    assert rotate(3, state, moves) is not None
+    assert decode_state(verifier.apply(encode_state(state), moves)) == rotate(3, state, moves)[0]